@@ -0,0 +1,268 @@
+"""
+Serial bus budget of the IOC, worked out from lm500Sup/lm500.db and lm500Sup/lm500.proto.
+
+For the records scanned periodically, estimates the transactions per second, request and reply
+bytes per second and the worst-case time the transactions of each scan period take on a serial
+line, and flags polls which read what other polls already do. Replies are estimated from the
+protocols' input formats, taking the widest a value is likely to be.
+
+Usage: python -m benchmarks.bus_budget [--baud-rate B] [--framing 8N1] [--processing-delay S]
+    [--db FILE] [--proto FILE] [--macro NAME=VALUE ...] [--max-utilisation PERCENT]
+    [--output results.json]
+"""
+
+import argparse
+import re
+import sys
+
+from lewis_emulators.Lm500.serial_line import SerialLine
+from stream_config import (
+    DATABASE_FILE,
+    DEFAULT_MACROS,
+    PROTOCOL_FILE,
+    expand,
+    parse_database,
+    parse_protocol_file,
+    protocol_requests,
+    scan_period,
+    stream_link,
+)
+
+from .common import write_results
+
+# Widest value assumed for each conversion of an input format without a width of its own
+CONVERSION_WIDTHS = {"d": 6, "i": 6, "u": 6, "x": 6, "o": 6, "f": 12, "e": 12, "g": 12}
+STRING_WIDTH = 12
+
+CONVERSION = re.compile(
+    r"%%|%(?:\([^)]*\))?[-+ #0*?=!]*(\d*)(?:\.\d+)?(\[(?:\]?[^\]]*)\]|/(?:\\.|[^/])*/|[a-zA-Z])"
+)
+
+# StreamDevice's default terminator when a protocol file does not set one
+DEFAULT_TERMINATOR = ""
+
+
+def reply_length(protocol, arguments, string_width=STRING_WIDTH):
+    """
+    Estimate the longest reply a protocol reads, without its terminator.
+
+    Args:
+        protocol: the Protocol
+        arguments: the protocol arguments
+        string_width: width assumed for strings
+
+    Returns:
+        the number of characters
+    """
+    length = 0
+    for command, values in protocol.commands:
+        if command != "in":
+            continue
+        for value in values:
+            # arguments are record names in redirections, so are replaced but not counted
+            format_string = expand(value, arguments)
+            position = 0
+            for match in CONVERSION.finditer(format_string):
+                length += match.start() - position
+                position = match.end()
+                if match.group(0) == "%%":
+                    length += 1
+                elif match.group(1):
+                    length += int(match.group(1))
+                else:
+                    length += CONVERSION_WIDTHS.get(match.group(2), string_width)
+            length += len(format_string) - position
+    return length
+
+
+def terminator_length(protocol_file, protocol, name):
+    terminator = protocol_file.variable(
+        protocol, name, protocol_file.variable(protocol, "Terminator", DEFAULT_TERMINATOR)
+    )
+    return len(expand(terminator))
+
+
+def transactions(records, protocol_file, string_width=STRING_WIDTH):
+    """
+    Args:
+        records: the records, as returned by parse_database
+        protocol_file: the ProtocolFile
+        string_width: width assumed for strings in replies
+
+    Returns:
+        list of dictionaries describing the transactions of the periodically scanned records
+    """
+    result = []
+    for _, name, fields in records:
+        link = stream_link(fields)
+        period = scan_period(fields)
+        if link is None or period is None:
+            continue
+        protocol = protocol_file.protocol(link[1])
+        requests = protocol_requests(protocol, link[2])
+        out_terminator = terminator_length(protocol_file, protocol, "OutTerminator")
+        in_terminator = terminator_length(protocol_file, protocol, "InTerminator")
+        reply = reply_length(protocol, link[2], string_width)
+        result.append(
+            {
+                "record": name,
+                "protocol": protocol.name,
+                "period": period,
+                "requests": [request.decode() for request in requests],
+                "request_bytes": sum(len(request) + out_terminator for request in requests),
+                "reply_bytes": reply + in_terminator if reply else 0,
+            }
+        )
+    return result
+
+
+def redundant_polls(transactions):
+    """
+    Find polls which read what others do: the same command polled by more than one record, or a
+    query of the default channel, e.g. MEAS?, polled with queries of the channels, e.g. MEAS? 1.
+
+    Args:
+        transactions: the transactions, as returned by transactions
+
+    Returns:
+        list of descriptions of the redundant polls
+    """
+    pollers = {}
+    for transaction in transactions:
+        for request in transaction["requests"]:
+            for command in request.split(";"):
+                pollers.setdefault(command.strip(), []).append(transaction["record"])
+
+    redundant = []
+    for command, records in pollers.items():
+        if len(records) > 1:
+            redundant.append(f"{command} is polled by {', '.join(records)}")
+        if " " not in command and command.endswith("?"):
+            channels = [
+                other
+                for other in pollers
+                if other.startswith(command + " ") and other[-1].isdigit()
+            ]
+            if channels:
+                readers = sorted({record for other in channels for record in pollers[other]})
+                redundant.append(
+                    f"{command} ({', '.join(records)}) reads the default channel, which "
+                    f"{', '.join(channels)} ({', '.join(readers)}) already read"
+                )
+    return redundant
+
+
+def budget(transactions, serial_line):
+    """
+    Args:
+        transactions: the transactions, as returned by transactions
+        serial_line: the SerialLine to time them on
+
+    Returns:
+        dictionary of the load per second and, by scan period, the time the transactions of the
+        period and all shorter periods take when they are due at once
+    """
+    periods = sorted({transaction["period"] for transaction in transactions})
+    per_period = {}
+    for period in periods:
+        due = [transaction for transaction in transactions if transaction["period"] <= period]
+        seconds = sum(
+            serial_line.transaction_time(transaction["request_bytes"], transaction["reply_bytes"])
+            for transaction in due
+        )
+        per_period[f"{period:g} second"] = {
+            "transactions": len(due),
+            "worst_case_seconds": seconds,
+            "utilisation_percent": seconds / period * 100,
+        }
+
+    return {
+        "transactions_per_second": sum(1 / transaction["period"] for transaction in transactions),
+        "request_bytes_per_second": sum(
+            transaction["request_bytes"] / transaction["period"] for transaction in transactions
+        ),
+        "reply_bytes_per_second": sum(
+            transaction["reply_bytes"] / transaction["period"] for transaction in transactions
+        ),
+        "line_seconds_per_second": sum(
+            serial_line.transaction_time(transaction["request_bytes"], transaction["reply_bytes"])
+            / transaction["period"]
+            for transaction in transactions
+        ),
+        "scan_periods": per_period,
+    }
+
+
+def parse_macro(macro):
+    name, value = macro.split("=", 1)
+    return name, value
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--baud-rate", type=float, default=9600, help="Serial line baud rate")
+    parser.add_argument("--framing", default="8N1", help="Serial line character framing")
+    parser.add_argument(
+        "--processing-delay", type=float, default=0.0, help="Time the device takes per command, s"
+    )
+    parser.add_argument("--db", default=DATABASE_FILE, help="Database file")
+    parser.add_argument("--proto", default=PROTOCOL_FILE, help="Protocol file")
+    parser.add_argument(
+        "--macro", type=parse_macro, action="append", default=[], help="Database macro NAME=VALUE"
+    )
+    parser.add_argument(
+        "--string-width", type=int, default=STRING_WIDTH, help="Width assumed for reply strings"
+    )
+    parser.add_argument(
+        "--max-utilisation",
+        type=float,
+        help="Fail if any scan period's worst case takes more than this percentage of it",
+    )
+    parser.add_argument("--output", help="Write the budget to this JSON file")
+    args = parser.parse_args()
+
+    records = parse_database(args.db, dict(DEFAULT_MACROS, **dict(args.macro)))
+    polled = transactions(records, parse_protocol_file(args.proto), args.string_width)
+    serial_line = SerialLine(args.baud_rate, args.framing, args.processing_delay)
+    result = budget(polled, serial_line)
+    redundant = redundant_polls(polled)
+
+    print(
+        f"At {args.baud_rate:g} baud {args.framing}, {args.processing_delay * 1000:g} ms a command:"
+    )
+    print(f"    {result['transactions_per_second']:8.1f} transactions/s")
+    print(f"    {result['request_bytes_per_second']:8.1f} request bytes/s")
+    print(f"    {result['reply_bytes_per_second']:8.1f} reply bytes/s")
+    print(f"    {result['line_seconds_per_second'] * 100:8.1f} % of the line's time")
+    for period, load in result["scan_periods"].items():
+        print(
+            f"    {period}: {load['transactions']} transactions take up to"
+            f" {load['worst_case_seconds'] * 1000:.1f} ms, {load['utilisation_percent']:.1f} %"
+        )
+    if redundant:
+        print("Redundant polls:")
+        for description in redundant:
+            print(f"    {description}")
+
+    if args.output:
+        write_results(
+            args.output,
+            {
+                "baud_rate": args.baud_rate,
+                "framing": args.framing,
+                "processing_delay": args.processing_delay,
+                "budget": result,
+                "transactions": polled,
+                "redundant_polls": redundant,
+            },
+        )
+
+    if args.max_utilisation is not None and any(
+        load["utilisation_percent"] > args.max_utilisation
+        for load in result["scan_periods"].values()
+    ):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
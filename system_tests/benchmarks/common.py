@@ -0,0 +1,137 @@
+"""
+Helpers shared by the Lm500 emulator benchmarks.
+
+The benchmarks are modules of the benchmarks package, run from system_tests with python -m, e.g.
+python -m benchmarks.throughput, so that lewis_emulators is imported as lewis imports it.
+"""
+
+import datetime
+import json
+import platform
+import socket
+import subprocess
+
+from emulator_process import SYSTEM_TESTS_DIR
+
+TERMINATOR = b"\r\n"
+
+# What the IOC polls every second, see lm500Sup/lm500.db
+POLLED_QUERIES = [
+    b"ALARM?",
+    b"BOOST?",
+    b"OUT?",
+    b"TYPE?",
+    b"TYPE? 1;TYPE? 2",
+    b"CHAN?",
+    b"ERROR?",
+    b"FILL?",
+    b"FILL? 1;FILL? 2",
+    b"HIGH?",
+    b"LOW?",
+    b"INTVL?",
+    b"MEAS?",
+    b"MEAS? 1;MEAS? 2",
+    b"MODE?",
+    b"LNGTH?",
+    b"STAT?",
+    b"UNITS?",
+]
+
+# Setpoints written now and again, which leave the device in its default state
+SETTERS = [
+    b"BOOST Off",
+    b"HIGH 10",
+    b"LOW 0",
+    b"UNITS CM",
+    b"MODE S",
+    b"MEAS 1",
+]
+
+COMMAND_MIX = POLLED_QUERIES + SETTERS
+
+
+def is_query(request):
+    return b"?" in request
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def summarise(commands, elapsed, latencies):
+    """
+    Args:
+        commands: number of commands sent
+        elapsed: seconds taken to send them
+        latencies: seconds taken to reply, per query
+
+    Returns:
+        dictionary of throughput and latency statistics
+    """
+    latencies = sorted(latencies)
+    return {
+        "commands": commands,
+        "seconds": elapsed,
+        "commands_per_second": commands / elapsed,
+        "p50_ms": percentile(latencies, 0.5) * 1000 if latencies else None,
+        "p99_ms": percentile(latencies, 0.99) * 1000 if latencies else None,
+        "max_ms": latencies[-1] * 1000 if latencies else None,
+    }
+
+
+def write_results(path, results):
+    """
+    Write benchmark results to a JSON file, with enough about the run to compare it with others.
+
+    Args:
+        path: file to write
+        results: dictionary of results
+    """
+    try:
+        revision = subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=SYSTEM_TESTS_DIR, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+
+    with open(path, "w") as results_file:
+        json.dump(
+            {
+                "revision": revision,
+                "time": datetime.datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "results": results,
+            },
+            results_file,
+            indent=4,
+        )
+
+
+class StreamClient(object):
+    """
+    A client connection to the emulator which, like StreamDevice, waits for the reply to a query
+    before sending anything else.
+    """
+
+    def __init__(self, port, host="127.0.0.1", timeout=10):
+        self._socket = socket.create_connection((host, port), timeout=timeout)
+        self._buffer = b""
+
+    def send(self, request):
+        self._socket.sendall(request + TERMINATOR)
+
+    def query(self, request):
+        self.send(request)
+        while TERMINATOR not in self._buffer:
+            data = self._socket.recv(4096)
+            if not data:
+                raise ConnectionError("Emulator closed the connection")
+            self._buffer += data
+        reply, self._buffer = self._buffer.split(TERMINATOR, 1)
+        return reply
+
+    def close(self):
+        self._socket.close()
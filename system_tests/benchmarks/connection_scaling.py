@@ -0,0 +1,111 @@
+"""
+Scaling benchmark of Lm500 emulator latency with the number of client connections.
+
+Each connection polls like an IOC, making the IOC's queries in turn once every scan period, from
+asyncio clients in this process. The emulators run in another process, either with lewis or with
+the asyncio transport of emulator_server, where the connections can also be spread
+over several emulated devices.
+
+Usage: python -m benchmarks.connection_scaling [--connections 1 4 16 64 256] [--devices N]
+    [--transports asyncio lewis] [--period P] [--seconds S] [--cycle-delay D]
+    [--output results.json]
+"""
+
+import argparse
+import asyncio
+import time
+
+from emulator_process import EmulatorProcess
+
+from .common import POLLED_QUERIES, TERMINATOR, summarise, write_results
+
+
+async def poll(port, phase, period, seconds, latencies):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    start = time.perf_counter()
+    scan = start + phase
+    try:
+        while scan < start + seconds:
+            await asyncio.sleep(max(0.0, scan - time.perf_counter()))
+            for request in POLLED_QUERIES:
+                sent = time.perf_counter()
+                writer.write(request + TERMINATOR)
+                await reader.readuntil(TERMINATOR)
+                latencies.append(time.perf_counter() - sent)
+            scan += period
+    finally:
+        writer.close()
+
+
+async def run_connections(ports, connections, period, seconds):
+    latencies = []
+    start = time.perf_counter()
+    # like IOCs started at different times, the connections poll at different points in the period
+    await asyncio.gather(
+        *(
+            poll(
+                ports[number % len(ports)],
+                period * number / connections,
+                period,
+                seconds,
+                latencies,
+            )
+            for number in range(connections)
+        )
+    )
+    summary = summarise(len(latencies), time.perf_counter() - start, latencies)
+    summary["connections"] = connections
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--connections", type=int, nargs="+", default=[1, 4, 16, 64, 256], help="Connections"
+    )
+    parser.add_argument(
+        "--devices", type=int, default=1, help="Emulated devices, with the asyncio transport"
+    )
+    parser.add_argument(
+        "--transports", nargs="+", default=["asyncio", "lewis"], choices=["asyncio", "lewis"]
+    )
+    parser.add_argument("--period", type=float, default=1.0, help="Scan period, s")
+    parser.add_argument("--seconds", type=float, default=5, help="Duration of each run")
+    parser.add_argument(
+        "--cycle-delay", type=float, default=0.1, help="Simulation cycle of the emulators, s"
+    )
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    results = {}
+    for transport in args.transports:
+        devices = args.devices if transport == "asyncio" else 1
+        results[transport] = []
+        with EmulatorProcess(
+            cycle_delay=args.cycle_delay, transport=transport, devices=devices
+        ) as emulator:
+            for connections in args.connections:
+                summary = asyncio.run(
+                    run_connections(emulator.ports, connections, args.period, args.seconds)
+                )
+                results[transport].append(summary)
+                print(
+                    f"{transport:<8} {connections:4d} connection(s)"
+                    f" {summary['commands_per_second']:8.0f} queries/s"
+                    f"  p50 {summary['p50_ms']:8.3f} ms  p99 {summary['p99_ms']:8.3f} ms"
+                )
+
+    if args.output:
+        write_results(
+            args.output,
+            {
+                "devices": args.devices,
+                "period": args.period,
+                "cycle_delay": args.cycle_delay,
+                "results": results,
+            },
+        )
+
+
+if __name__ == "__main__":
+    main()
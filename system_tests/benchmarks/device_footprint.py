@@ -0,0 +1,90 @@
+"""
+Benchmark of the memory and simulation cycle time of hosting many Lm500 emulator devices in one
+process, with every device idle and with both channels of every device filling. With --fleet,
+also of the devices simulated together as a Fleet, which needs NumPy.
+
+Usage: python -m benchmarks.device_footprint [--devices N] [--cycles N] [--fleet]
+"""
+
+import argparse
+import time
+import tracemalloc
+
+from lewis_emulators.Lm500 import SimulatedLm500
+
+CYCLE_DELAY = 0.1
+
+
+def create_devices(count):
+    tracemalloc.start()
+    devices = [SimulatedLm500(override_initial_data={"fill_logging": False}) for _ in range(count)]
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return devices, memory
+
+
+def create_fleet(count):
+    # NumPy is only needed for a fleet
+    from emulator_fleet import Fleet
+
+    tracemalloc.start()
+    fleet = Fleet(count, override_initial_data={"fill_logging": False})
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return fleet, memory
+
+
+def cycle_time(devices, cycles):
+    start = time.perf_counter()
+    for _ in range(cycles):
+        for device in devices:
+            device.process(CYCLE_DELAY)
+    return (time.perf_counter() - start) / cycles / len(devices)
+
+
+def fleet_cycle_time(fleet, cycles):
+    start = time.perf_counter()
+    for _ in range(cycles):
+        fleet.process(CYCLE_DELAY)
+    return (time.perf_counter() - start) / cycles / len(fleet.devices)
+
+
+def start_filling(devices):
+    for device in devices:
+        device.high_threshold = 1e9
+        device.max_fill_time = 1e9
+        device.fill(1)
+        device.fill(2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--devices", type=int, default=500, help="Number of devices")
+    parser.add_argument("--cycles", type=int, default=100, help="Cycles of every device per run")
+    parser.add_argument("--fleet", action="store_true", help="Also simulate a Fleet, needs NumPy")
+    args = parser.parse_args()
+
+    devices, memory = create_devices(args.devices)
+    print(f"memory:  {memory / args.devices:8.0f} bytes/device")
+
+    for device in devices:
+        device.process(CYCLE_DELAY)
+    print(f"idle:    {cycle_time(devices, args.cycles) * 1e6:8.2f} us/device/cycle")
+
+    start_filling(devices)
+    for device in devices:
+        device.process(CYCLE_DELAY)
+    print(f"filling: {cycle_time(devices, args.cycles) * 1e6:8.2f} us/device/cycle")
+
+    if args.fleet:
+        fleet, memory = create_fleet(args.devices)
+        print(f"fleet memory:  {memory / args.devices:8.0f} bytes/device")
+        fleet.process(CYCLE_DELAY)
+        print(f"fleet idle:    {fleet_cycle_time(fleet, args.cycles) * 1e6:8.2f} us/device/cycle")
+        start_filling(fleet.devices)
+        fleet.process(CYCLE_DELAY)
+        print(f"fleet filling: {fleet_cycle_time(fleet, args.cycles) * 1e6:8.2f} us/device/cycle")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Micro-benchmark of the Lm500 emulator's command dispatch.
+
+Compares matching each request against every bound command in turn (what the lewis stream
+handler does on its own) with the keyword-indexed dispatcher of Lm500StreamInterface, without its
+reply cache or metrics so that only the matching is timed. The requests are those the IOC polls.
+
+Usage: python -m benchmarks.dispatch [--requests N]
+"""
+
+import argparse
+import time
+
+from lewis_emulators.Lm500 import SimulatedLm500
+from lewis_emulators.Lm500.interfaces import Lm500StreamInterface
+from lewis_emulators.Lm500.interfaces.dispatch import COMMAND_SEPARATOR, CommandDispatcher
+from lewis_emulators.Lm500.metrics import Metrics
+
+from .common import POLLED_QUERIES
+
+
+def linear_scan(commands, request):
+    replies = []
+    for command in request.split(COMMAND_SEPARATOR):
+        cmd = next(cmd for cmd in commands if cmd.can_process(command))
+        reply = cmd.process_request(command)
+        if reply is not None:
+            replies.append(reply)
+    return COMMAND_SEPARATOR.decode().join(replies) if replies else None
+
+
+def indexed(dispatcher, request):
+    return dispatcher.dispatch(request)
+
+
+def bare_dispatcher(commands):
+    """
+    Args:
+        commands: the interface's bound commands, without its dispatcher
+
+    Returns:
+        a CommandDispatcher of the commands, which caches no replies and records no metrics
+    """
+    metrics = Metrics()
+    metrics.enabled = False
+    return CommandDispatcher(commands, cached=(), metrics=metrics)
+
+
+def requests_per_second(process, target, requests):
+    start = time.perf_counter()
+    for request in requests:
+        process(target, request)
+    return len(requests) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=200000, help="Requests per run")
+    args = parser.parse_args()
+
+    interface = Lm500StreamInterface()
+    interface.device = SimulatedLm500()
+    # the first bound command is the interface's own dispatcher
+    commands = interface.bound_commands[1:]
+    dispatcher = bare_dispatcher(commands)
+    requests = (POLLED_QUERIES * (args.requests // len(POLLED_QUERIES) + 1))[: args.requests]
+
+    assert [indexed(dispatcher, r) for r in POLLED_QUERIES] == [
+        linear_scan(commands, r) for r in POLLED_QUERIES
+    ]
+
+    linear = requests_per_second(linear_scan, commands, requests)
+    index = requests_per_second(indexed, dispatcher, requests)
+    print(f"linear scan: {linear:12.0f} requests/s")
+    print(f"indexed:     {index:12.0f} requests/s")
+    print(f"speed up:    {index / linear:12.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Benchmark of the Lm500 emulator's simulation cycle time while both channels are filling, with
+fill progress logging disabled, rate limited (the default) and logged every cycle.
+
+Usage: python -m benchmarks.fill_logging [--cycles N]
+"""
+
+import argparse
+import io
+import logging
+import time
+
+from lewis_emulators.Lm500 import SimulatedLm500
+
+CYCLE_DELAY = 0.1
+
+
+def filling_device(**parameters):
+    device = SimulatedLm500(override_initial_data=parameters)
+    device.high_threshold = 1e9
+    device.max_fill_time = 1e9
+    device.process(CYCLE_DELAY)
+    device.fill(1)
+    device.process(CYCLE_DELAY)
+    device.fill(2)
+    device.process(CYCLE_DELAY)
+    assert device.state == "both"
+    return device
+
+
+def cycle_time(device, cycles, repeats=3):
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(cycles):
+            device.process(CYCLE_DELAY)
+        elapsed = (time.perf_counter() - start) / cycles
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--cycles", type=int, default=50000, help="Cycles per run")
+    args = parser.parse_args()
+
+    # Log as lewis does by default, but into memory so the terminal isn't the bottleneck
+    logging.basicConfig(level=logging.INFO, stream=io.StringIO())
+
+    runs = [
+        ("logging off", {"fill_logging": False}),
+        ("rate limited", {}),
+        ("every cycle", {"fill_log_interval": 0}),
+    ]
+    for name, parameters in runs:
+        device = filling_device(**parameters)
+        print(f"{name:13} {cycle_time(device, args.cycles) * 1e6:8.2f} us/cycle")
+        assert device.state == "both"
+
+
+if __name__ == "__main__":
+    main()
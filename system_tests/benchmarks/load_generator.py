@@ -0,0 +1,240 @@
+"""
+Load generator replaying the IOC's polling of the device against Lm500 emulators.
+
+Works out the queries the IOC makes every second from lm500Sup/lm500.db and lm500Sup/lm500.proto,
+then simulates increasing numbers of IOCs, each with its own connection making those queries every
+scan period, to find how many IOCs can be served before replies take longer than the protocol's
+ReplyTimeout. IOCs are spread over the emulators given, or over emulators started with lewis,
+taken from an EmulatorPool and reset for each number of IOCs, or with the asyncio transport, which
+can also give replies the timing of a serial line.
+
+Usage: python -m benchmarks.load_generator [--iocs 1 2 4 8]
+    [--emulators M | --address HOST:PORT ...] [--transport lewis|asyncio] [--baud-rate B]
+    [--processing-delay S] [--speed X] [--seconds S] [--cycle-delay D] [--show-mix]
+    [--output results.json]
+"""
+
+import argparse
+import contextlib
+import socket
+import threading
+import time
+
+from emulator_pool import EmulatorPool
+from emulator_process import EmulatorProcess
+from stream_config import parse_database, parse_protocol_file, polled_transactions
+
+from .common import StreamClient, summarise, write_results
+
+# StreamDevice's default, for protocols which do not set it
+DEFAULT_REPLY_TIMEOUT = 1000
+
+
+def polling_mix(protocol_file, records):
+    """
+    Args:
+        protocol_file: the ProtocolFile
+        records: the records, as returned by parse_database
+
+    Returns:
+        list of (request, whether a reply is expected, reply timeout in seconds) made each period
+    """
+    mix = []
+    for _, protocol, _, requests in polled_transactions(records, protocol_file):
+        expects_reply = any(command == "in" for command, _ in protocol.commands)
+        reply_timeout = float(
+            protocol_file.variable(protocol, "ReplyTimeout", DEFAULT_REPLY_TIMEOUT)
+        )
+        mix.extend((request, expects_reply, reply_timeout / 1000) for request in requests)
+    return mix
+
+
+class SimulatedIoc(object):
+    """
+    Polls an emulator as one IOC would, one transaction at a time, every scan period.
+    """
+
+    def __init__(self, address, mix, period):
+        self.address = address
+        self.mix = mix
+        self.period = period
+        self.commands = 0
+        self.latencies = []
+        self.timeouts = 0
+        self.overruns = 0
+        self._client = None
+
+    def _connect(self):
+        if self._client is not None:
+            self._client.close()
+        host, port = self.address
+        self._client = StreamClient(port, host, timeout=max(timeout for _, _, timeout in self.mix))
+
+    def _transact(self, request, expects_reply, reply_timeout):
+        sent = time.perf_counter()
+        if not expects_reply:
+            self._client.send(request)
+            return
+        try:
+            self._client.query(request)
+        except socket.timeout:
+            # a late reply would be taken for the next one, so start afresh like a new connection
+            self.timeouts += 1
+            self._connect()
+            return
+        latency = time.perf_counter() - sent
+        self.latencies.append(latency)
+        if latency > reply_timeout:
+            self.timeouts += 1
+
+    def run(self, start, seconds, barrier):
+        self._connect()
+        barrier.wait()
+        scan = start
+        try:
+            while scan < start + seconds:
+                time.sleep(max(0.0, scan - time.perf_counter()))
+                for request, expects_reply, reply_timeout in self.mix:
+                    self._transact(request, expects_reply, reply_timeout)
+                    self.commands += 1
+                scan += self.period
+                if time.perf_counter() > scan:
+                    # the scan thread would find the queries of this period still queued
+                    self.overruns += 1
+        finally:
+            self._client.close()
+
+
+def run_iocs(addresses, iocs, mix, period, seconds):
+    simulated = [SimulatedIoc(addresses[ioc % len(addresses)], mix, period) for ioc in range(iocs)]
+    barrier = threading.Barrier(iocs + 1)
+    start = time.perf_counter() + 0.5
+    threads = [
+        threading.Thread(target=ioc.run, args=(start, seconds, barrier)) for ioc in simulated
+    ]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    for thread in threads:
+        thread.join()
+
+    summary = summarise(
+        sum(ioc.commands for ioc in simulated),
+        time.perf_counter() - start,
+        [latency for ioc in simulated for latency in ioc.latencies],
+    )
+    summary["iocs"] = iocs
+    summary["timeouts"] = sum(ioc.timeouts for ioc in simulated)
+    summary["overruns"] = sum(ioc.overruns for ioc in simulated)
+    return summary
+
+
+def parse_address(address):
+    host, port = address.rsplit(":", 1)
+    return host, int(port)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--iocs", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32], help="Numbers of IOCs to try"
+    )
+    parser.add_argument("--emulators", type=int, default=1, help="Emulators to start")
+    parser.add_argument(
+        "--address",
+        type=parse_address,
+        action="append",
+        help="HOST:PORT of a running emulator to use instead of starting them, can be repeated",
+    )
+    parser.add_argument(
+        "--transport", default="lewis", choices=["lewis", "asyncio"], help="Emulators to start"
+    )
+    parser.add_argument(
+        "--baud-rate", type=float, help="Serial line baud rate, with the asyncio transport"
+    )
+    parser.add_argument(
+        "--processing-delay", type=float, help="Time to process a command, with asyncio, s"
+    )
+    parser.add_argument(
+        "--speed", type=float, default=1, help="Scan this many times faster than the IOC"
+    )
+    parser.add_argument("--seconds", type=float, default=10, help="Duration of each run")
+    parser.add_argument(
+        "--cycle-delay", type=float, default=0.1, help="lewis cycle delay of started emulators, s"
+    )
+    parser.add_argument(
+        "--show-mix", action="store_true", help="Print the queries made each period and exit"
+    )
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    mix = polling_mix(parse_protocol_file(), parse_database())
+    if args.show_mix:
+        for request, expects_reply, reply_timeout in mix:
+            reply = f"reply within {reply_timeout * 1000:.0f} ms" if expects_reply else "no reply"
+            print(f"{request.decode():<20} {reply}")
+        return
+
+    period = 1 / args.speed
+    serial_options = []
+    if args.baud_rate is not None:
+        serial_options += ["--baud-rate", str(args.baud_rate)]
+    if args.processing_delay is not None:
+        serial_options += ["--processing-delay", str(args.processing_delay)]
+    results = []
+    sustained = 0
+    with contextlib.ExitStack() as stack:
+        pool = None
+        if args.address:
+            addresses = args.address
+        elif args.transport == "asyncio":
+            emulators = stack.enter_context(
+                EmulatorProcess(
+                    cycle_delay=args.cycle_delay,
+                    transport="asyncio",
+                    devices=args.emulators,
+                    serial_options=serial_options,
+                )
+            )
+            addresses = [("127.0.0.1", port) for port in emulators.ports]
+        else:
+            pool = stack.enter_context(EmulatorPool(args.emulators, args.cycle_delay))
+        for iocs in args.iocs:
+            with contextlib.ExitStack() as emulators:
+                if pool is not None:
+                    # each number of IOCs polls emulators reset to their initial state
+                    addresses = [
+                        ("127.0.0.1", emulators.enter_context(pool.emulator()).port)
+                        for _ in range(args.emulators)
+                    ]
+                summary = run_iocs(addresses, iocs, mix, period, args.seconds)
+            results.append(summary)
+            print(
+                f"{iocs:4d} IOC(s) {summary['commands_per_second']:10.0f} commands/s"
+                f"  p50 {summary['p50_ms']:8.1f} ms  p99 {summary['p99_ms']:8.1f} ms"
+                f"  max {summary['max_ms']:8.1f} ms  timeouts {summary['timeouts']}"
+                f"  overruns {summary['overruns']}"
+            )
+            if summary["timeouts"]:
+                break
+            sustained = iocs
+
+    print(f"IOCs sustained without reply timeouts: {sustained}")
+    if args.output:
+        write_results(
+            args.output,
+            {
+                "emulators": len(args.address or []) or args.emulators,
+                "transport": None if args.address else args.transport,
+                "serial_options": serial_options,
+                "speed": args.speed,
+                "cycle_delay": args.cycle_delay,
+                "queries_per_period": len(mix),
+                "sustained_iocs": sustained,
+                "runs": results,
+            },
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+How long the IOC's readbacks of the channels' measurements lag a measurement, for sensors of
+different lengths, with the device's measurement model and serial line timing.
+
+For each sensor length and channel, puts the record starting a measurement, then processes the
+measurement readback records each scan period, advancing the device's simulated time between
+scans, as lm500Sup/lm500.proto would be run in the IOC, until the measurement has ended and been
+read. Reports how long each measurement takes, the scans the readback is stale for, the reading
+against the level and any replies which miss the protocols' ReplyTimeout. Exits with 1 if any do,
+or if a readback is stale for more than --max-stale-scans.
+
+Usage: python -m benchmarks.measurement_latency [--sensor-lengths 10,30,60]
+    [--duration S] [--helium-seconds-per-length S] [--nitrogen-seconds-per-length S] [--noise N]
+    [--boil-off-rate R] [--baud-rate B] [--processing-delay S] [--max-stale-scans N]
+    [--output results.json]
+"""
+
+import argparse
+import math
+import sys
+
+from lewis_emulators.Lm500.measurements import HELIUM
+from protocol_checks import PREFIX, new_ioc
+from stream_config import scan_period
+from stream_protocol import StreamError
+
+from .common import write_results
+
+# The record polling both channels' measurements, reading channel 2's into MEAS:CHAN2
+READBACK = "MEAS:CHAN1"
+LEVEL = 50.0
+
+
+def measure(ioc, channel, period, max_scans):
+    """
+    Start a measurement of a channel and scan its readback until the measurement has been read.
+
+    Args:
+        ioc: the StreamIoc, with its device set up
+        channel: the channel number
+        period: seconds between scans
+        max_scans: the most scans to wait for
+
+    Returns:
+        dictionary of the measurement's time, the scans the readback was stale for, the reading
+        and the errors of the scans
+    """
+    device = ioc.interface.device
+    data = device.channel_data(channel)
+    errors = []
+    seconds = device.measurement_time(data)
+    ioc.put(f"{PREFIX}MEAS:CHAN{channel}:SP", 1)
+
+    stale = 0
+    while stale < max_scans:
+        device.advance_time(period)
+        ended = data.read_until is None
+        try:
+            ioc.process(PREFIX + READBACK)
+        except StreamError as error:
+            errors.append(str(error))
+        if ended:
+            break
+        stale += 1
+    return {
+        "seconds": seconds,
+        "stale_scans": stale,
+        "reading": ioc.get(f"{PREFIX}MEAS:CHAN{channel}"),
+        "level": data.value,
+        "errors": errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--sensor-lengths", default="10,30,60", help="Comma separated sensor lengths, in the units"
+    )
+    parser.add_argument(
+        "--helium-seconds-per-length",
+        type=float,
+        default=0.1,
+        help="Time to measure a helium sensor per unit of length, s",
+    )
+    parser.add_argument(
+        "--nitrogen-seconds-per-length",
+        type=float,
+        default=0.0,
+        help="Time to measure a nitrogen sensor per unit of length, s",
+    )
+    parser.add_argument("--duration", type=float, default=0.0, help="Time any measurement takes")
+    parser.add_argument("--noise", type=float, default=0.0, help="Standard deviation of readings")
+    parser.add_argument(
+        "--boil-off-rate", type=float, default=0.0, help="Helium level lost per second of reading"
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the noise")
+    parser.add_argument("--baud-rate", type=float, default=9600, help="Serial line baud rate")
+    parser.add_argument("--framing", default="8N1", help="Serial line character framing")
+    parser.add_argument(
+        "--processing-delay", type=float, default=0.0, help="Time the device takes per command, s"
+    )
+    parser.add_argument(
+        "--max-stale-scans", type=int, help="Fail if a readback is stale for more scans than this"
+    )
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    ioc = new_ioc()
+    device = ioc.interface.device
+    period = scan_period(ioc.records[PREFIX + READBACK].fields)
+    results = []
+    for length in (float(length) for length in args.sensor_lengths.split(",")):
+        for channel in range(1, device.channel_count + 1):
+            device.reset()
+            device.set_serial_timing(args.baud_rate, args.framing, args.processing_delay)
+            device.set_measurement_model(
+                args.helium_seconds_per_length,
+                args.nitrogen_seconds_per_length,
+                args.noise,
+                args.boil_off_rate,
+                args.seed,
+            )
+            device.measurement_duration = args.duration
+            device.sensor_length = length
+            device.channel_data(channel).value = LEVEL
+            device.process(0)
+            seconds = device.measurement_time(device.channel_data(channel))
+            result = measure(ioc, channel, period, math.ceil(seconds / period) + 2)
+            result.update(
+                sensor_length=length,
+                channel=channel,
+                sensor="helium" if device.channel_data(channel).type == HELIUM else "nitrogen",
+            )
+            results.append(result)
+
+    print(f"Readbacks scanned every {period:g} s, at {args.baud_rate:g} baud {args.framing}:")
+    for result in results:
+        print(
+            f"    length {result['sensor_length']:g}, channel {result['channel']}"
+            f" ({result['sensor']}): {result['seconds']:.1f} s,"
+            f" stale for {result['stale_scans']} scans, read {result['reading']:g}"
+            f" of {result['level']:g}"
+        )
+        for error in result["errors"]:
+            print(f"        {error}")
+
+    if args.output:
+        write_results(args.output, {"scan_period": period, "measurements": results})
+
+    if any(result["errors"] for result in results) or (
+        args.max_stale_scans is not None
+        and any(result["stale_scans"] > args.max_stale_scans for result in results)
+    ):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
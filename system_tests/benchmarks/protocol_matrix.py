@@ -0,0 +1,90 @@
+"""
+Timed protocol-level checks of the IOC against the Lm500 emulator, without an IOC or channel access.
+
+Runs the @init handlers of every stream record, processes each record once, then runs the
+setpoint and readback cases of the DEVSIM tests in tests/lm500.py, each on a reset device, with
+protocol_checks, which tests/lm500_emulator.py also runs as a test. Reports the records whose
+protocols fail, e.g. because the database names a protocol the protocol file does not have or the
+emulator does not understand a request, and how long the checks took. Exits with 1 if any fail.
+
+Usage: python -m benchmarks.protocol_matrix [--repeat N] [--baud-rate B] [--processing-delay S]
+    [--output results.json]
+"""
+
+import argparse
+import sys
+import time
+
+from protocol_checks import new_ioc, process_all, run_setpoint_cases
+from stream_protocol import StreamError
+
+from .common import write_results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--repeat", type=int, default=100, help="Times to repeat, for timing")
+    parser.add_argument(
+        "--baud-rate", type=float, default=0, help="Serial line baud rate, 0 for instant replies"
+    )
+    parser.add_argument(
+        "--processing-delay", type=float, default=0.0, help="Time the device takes per command, s"
+    )
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    serial_timing = (args.baud_rate, "8N1", args.processing_delay)
+    ioc = new_ioc()
+    ioc.interface.device.set_serial_timing(*serial_timing)
+    init_errors = ioc.initialise()
+    process_errors = process_all(ioc)
+    cases, failures = run_setpoint_cases(ioc, serial_timing)
+
+    start = time.perf_counter()
+    transactions = ioc.transactions
+    for _ in range(args.repeat):
+        run_setpoint_cases(ioc, serial_timing)
+    elapsed = time.perf_counter() - start
+    transactions = ioc.transactions - transactions
+
+    for title, errors in (
+        ("@init failed", init_errors),
+        ("Processing failed", process_errors),
+        ("Setpoint cases failed", failures),
+    ):
+        if errors:
+            print(f"{title}:")
+            for name, error in errors.items():
+                # errors of records start with the record's name
+                print(f"    {error}" if isinstance(error, StreamError) else f"    {name}: {error}")
+    print(
+        f"{len(ioc.links)} stream records, {cases} setpoint cases, "
+        f"{len(init_errors) + len(process_errors) + len(failures)} failures"
+    )
+    print(
+        f"{cases * args.repeat / elapsed:.0f} cases/s, {transactions / elapsed:.0f} transactions/s,"
+        f" {elapsed / (cases * args.repeat) * 1e6:.0f} us a case"
+    )
+
+    if args.output:
+        write_results(
+            args.output,
+            {
+                "stream_records": len(ioc.links),
+                "cases": cases,
+                "cases_per_second": cases * args.repeat / elapsed,
+                "transactions_per_second": transactions / elapsed,
+                "failures": {
+                    name: str(error)
+                    for errors in (init_errors, process_errors, failures)
+                    for name, error in errors.items()
+                },
+            },
+        )
+
+    if init_errors or process_errors or failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Micro-benchmark of the Lm500 emulator's cache of replies to queries of its settings.
+
+Compares dispatching the read-only queries the IOC polls, and the IOC's whole polling mix, with the
+reply cache against formatting every reply afresh.
+
+Usage: python -m benchmarks.reply_cache [--requests N]
+"""
+
+import argparse
+import time
+
+from lewis_emulators.Lm500 import SimulatedLm500
+from lewis_emulators.Lm500.interfaces import Lm500StreamInterface
+
+from .common import POLLED_QUERIES
+
+SETTING_QUERIES = [
+    b"HIGH?",
+    b"LOW?",
+    b"ALARM?",
+    b"LNGTH?",
+    b"UNITS?",
+    b"MODE?",
+    b"TYPE?",
+    b"TYPE? 1;TYPE? 2",
+    b"INTVL?",
+]
+
+
+def new_interface(cached):
+    interface = Lm500StreamInterface()
+    interface.device = SimulatedLm500()
+    if not cached:
+        interface.dispatcher.cached = set()
+    return interface
+
+
+def commands_per_second(interface, requests):
+    start = time.perf_counter()
+    for request in requests:
+        interface.handle_request(request)
+    return len(requests) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=200000, help="Requests per run")
+    args = parser.parse_args()
+
+    for name, mix in (("setting queries", SETTING_QUERIES), ("polling mix", POLLED_QUERIES)):
+        requests = (mix * (args.requests // len(mix) + 1))[: args.requests]
+        uncached, cached = new_interface(False), new_interface(True)
+        assert [uncached.handle_request(r) for r in mix] == [cached.handle_request(r) for r in mix]
+
+        without_cache = commands_per_second(uncached, requests)
+        with_cache = commands_per_second(cached, requests)
+        print(f"{name}:")
+        print(f"    without cache: {without_cache:12.0f} commands/s")
+        print(f"    with cache:    {with_cache:12.0f} commands/s")
+        print(f"    speed up:      {with_cache / without_cache:12.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Throughput and latency benchmark of the Lm500 emulator.
+
+Sends the IOC's command mix to Lm500StreamInterface, first directly in this process and then over
+TCP to an emulator run by lewis with an increasing number of concurrent clients, taking the
+emulator from an EmulatorPool so that each number of clients has it reset, and reports
+commands/s with p50/p99 query latency for each.
+
+Usage: python -m benchmarks.throughput [--requests N] [--seconds S] [--clients 1 2 4 8]
+    [--cycle-delay D] [--output results.json]
+"""
+
+import argparse
+import threading
+import time
+
+from emulator_pool import EmulatorPool
+from lewis_emulators.Lm500 import SimulatedLm500
+from lewis_emulators.Lm500.interfaces import Lm500StreamInterface
+
+from .common import (
+    COMMAND_MIX,
+    StreamClient,
+    is_query,
+    summarise,
+    write_results,
+)
+
+
+def handle(interface, request):
+    # what the lewis stream handler does with each request it receives
+    cmd = next(cmd for cmd in interface.bound_commands if cmd.can_process(request))
+    return cmd.process_request(request)
+
+
+def run_direct(requests):
+    interface = Lm500StreamInterface()
+    interface.device = SimulatedLm500()
+    latencies = []
+    start = time.perf_counter()
+    for request in requests:
+        sent = time.perf_counter()
+        handle(interface, request)
+        latencies.append(time.perf_counter() - sent)
+    return summarise(len(requests), time.perf_counter() - start, latencies)
+
+
+def run_client(port, seconds, barrier, results):
+    client = StreamClient(port)
+    commands = 0
+    latencies = []
+    barrier.wait()
+    deadline = time.perf_counter() + seconds
+    try:
+        while time.perf_counter() < deadline:
+            for request in COMMAND_MIX:
+                sent = time.perf_counter()
+                if is_query(request):
+                    client.query(request)
+                    latencies.append(time.perf_counter() - sent)
+                else:
+                    client.send(request)
+                commands += 1
+    finally:
+        client.close()
+    results.append((commands, latencies))
+
+
+def run_tcp(port, clients, seconds):
+    barrier = threading.Barrier(clients + 1)
+    results = []
+    threads = [
+        threading.Thread(target=run_client, args=(port, seconds, barrier, results))
+        for _ in range(clients)
+    ]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    if len(results) != clients:
+        raise RuntimeError("A client failed, see above")
+
+    summary = summarise(
+        sum(commands for commands, _ in results),
+        elapsed,
+        [latency for _, latencies in results for latency in latencies],
+    )
+    summary["clients"] = clients
+    return summary
+
+
+def print_summary(name, summary):
+    print(
+        f"{name:<12} {summary['commands_per_second']:12.0f} commands/s"
+        f"  p50 {summary['p50_ms']:8.3f} ms  p99 {summary['p99_ms']:8.3f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=100000, help="Requests sent directly")
+    parser.add_argument("--seconds", type=float, default=5, help="Duration of each TCP run")
+    parser.add_argument(
+        "--clients", type=int, nargs="+", default=[1, 2, 4, 8], help="Concurrent TCP clients"
+    )
+    parser.add_argument(
+        "--cycle-delay", type=float, default=0.1, help="lewis cycle delay of the emulator, s"
+    )
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    requests = (COMMAND_MIX * (args.requests // len(COMMAND_MIX) + 1))[: args.requests]
+    direct = run_direct(requests)
+    print_summary("direct", direct)
+
+    tcp = []
+    with EmulatorPool(size=1, cycle_delay=args.cycle_delay) as pool:
+        for clients in args.clients:
+            # each number of clients starts from the device's initial state
+            with pool.emulator() as emulator:
+                summary = run_tcp(emulator.port, clients, args.seconds)
+            print_summary(f"{clients} client(s)", summary)
+            tcp.append(summary)
+
+    if args.output:
+        write_results(
+            args.output,
+            {"cycle_delay": args.cycle_delay, "direct": direct, "tcp": tcp},
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,355 @@
+"""
+A fleet of Lm500 emulators simulated together, for scaling tests of many level meters in one
+process, e.g. of archiving and alarm handling.
+
+The fill data of every channel of every device is kept in NumPy arrays, which the fleet steps all
+at once each simulation cycle: the level approaching the high threshold, the fill time and the
+checks for the high threshold and fill timeout. Only the channels whose fill starts or stops, and
+the devices which have measurements, history or events due, are then handled one by one, by the
+same code as a single device, so a cycle of an idle fleet costs a few array operations however
+many devices it has.
+
+Each device is a FleetLm500, which behaves as a SimulatedLm500 and is served through its own
+Lm500StreamInterface like any other, e.g. by AsyncStreamServer with fleet given. The devices share
+the fleet's clock, so restoring one does not move the others' simulated time, and advancing the
+time of one advances them all.
+
+Needs NumPy, which the emulator otherwise does not, so it is kept out of the lewis_emulators
+package, all of whose modules lewis imports when it loads a device.
+"""
+
+import math
+
+import numpy as np
+from lewis_emulators.Lm500.channel import Lm500Channel
+from lewis_emulators.Lm500.clock import SimulationClock
+from lewis_emulators.Lm500.device import SimulatedLm500
+
+# Settings of the devices, kept in the fleet's arrays for each of their channels
+FLEET_SETTINGS = ("high_threshold", "fill_speed", "max_fill_time")
+
+
+def _array_data(name, to_python):
+    """
+    Data of a FleetChannel, kept in the fleet's array of that name.
+    """
+
+    def get_data(self):
+        return to_python(getattr(self._fleet, name)[self._index])
+
+    def set_data(self, value):
+        getattr(self._fleet, name)[self._index] = value
+
+    return property(get_data, set_data)
+
+
+class FleetChannel(Lm500Channel):
+    """
+    The data of a channel of a fleet's device, with the data the fleet steps kept in its arrays.
+    """
+
+    __slots__ = ("_fleet", "_index")
+
+    filling = _array_data("filling", bool)
+    fill_time = _array_data("fill_time", int)
+
+    def __init__(self, fleet, index, number, sensor_type=0):
+        """
+        Args:
+            fleet: the Fleet
+            index: the index of the channel's data in the fleet's arrays
+            number: the channel number, starting from 1
+            sensor_type: 0 for a helium sensor, 1 for nitrogen
+        """
+        self._fleet = fleet
+        self._index = index
+        super(FleetChannel, self).__init__(number, sensor_type)
+
+    value = _array_data("value", float)
+
+    @property
+    def fill_start(self):
+        fill_start = self._fleet.fill_start[self._index]
+        return None if math.isnan(fill_start) else float(fill_start)
+
+    @fill_start.setter
+    def fill_start(self, fill_start):
+        self._fleet.fill_start[self._index] = math.nan if fill_start is None else fill_start
+
+
+class FleetLm500(SimulatedLm500):
+    """
+    A device of a Fleet, stepped by the fleet's process rather than its own.
+    """
+
+    def __init__(self, fleet, index, channel_count=2, **kwargs):
+        """
+        Args:
+            fleet: the Fleet
+            index: the number of the device in the fleet, from 0
+            channel_count: number of level meter channels, 2 for the LM-500
+            kwargs: passed on to SimulatedLm500
+        """
+        self._fleet = fleet
+        self._index = index
+        super(FleetLm500, self).__init__(channel_count=channel_count, **kwargs)
+
+    def _initialize_data(self):
+        super(FleetLm500, self)._initialize_data()
+        self.clock = self._fleet.clock
+
+    def _new_channel(self, number):
+        index = self._index * self.channel_count + number - 1
+        return FleetChannel(self._fleet, index, number, sensor_type=1 if number == 1 else 0)
+
+    @SimulatedLm500.high_threshold.setter
+    def high_threshold(self, threshold):
+        SimulatedLm500.high_threshold.fset(self, threshold)
+        self._fleet.set_setting(self._index, "high_threshold", threshold)
+
+    @SimulatedLm500.max_fill_time.setter
+    def max_fill_time(self, max_fill_time):
+        SimulatedLm500.max_fill_time.fset(self, max_fill_time)
+        self._fleet.set_setting(self._index, "max_fill_time", max_fill_time)
+
+    @property
+    def fill_speed(self):
+        return self._fill_speed
+
+    @fill_speed.setter
+    def fill_speed(self, speed):
+        self._fill_speed = speed
+        self._fleet.set_setting(self._index, "fill_speed", speed)
+
+    @SimulatedLm500.sample_mode.setter
+    def sample_mode(self, mode):
+        SimulatedLm500.sample_mode.fset(self, mode)
+        self._fleet.wake(self)
+
+    @SimulatedLm500.sample_interval.setter
+    def sample_interval(self, interval):
+        SimulatedLm500.sample_interval.fset(self, interval)
+        self._fleet.wake(self)
+
+    def set_measurement(self, channel):
+        super(FleetLm500, self).set_measurement(channel)
+        self._fleet.wake(self)
+
+    def set_history(self, interval, capacity=3600):
+        super(FleetLm500, self).set_history(interval, capacity)
+        self._fleet.wake(self)
+
+    def start_events(self, port=0):
+        port = super(FleetLm500, self).start_events(port)
+        self._fleet.wake(self)
+        return port
+
+    def restore(self, snapshot):
+        """
+        Put the device back in a state saved by snapshot, all at once. The devices of a fleet
+        share its clock, so the times in the snapshot are moved to now rather than the clock to
+        the snapshot's time.
+
+        Args:
+            snapshot: the state to restore, as returned by snapshot
+        """
+        offset = self.clock.time - snapshot["time"]
+
+        def moved(time):
+            return None if time is None else time + offset
+
+        snapshot = dict(
+            snapshot,
+            time=self.clock.time,
+            next_sample=moved(snapshot["next_sample"]),
+            channels=[
+                dict(
+                    data, fill_start=moved(data["fill_start"]), read_until=moved(data["read_until"])
+                )
+                for data in snapshot["channels"]
+            ],
+        )
+        super(FleetLm500, self).restore(snapshot)
+        self._fleet.wake(self)
+
+    def advance_time(self, seconds):
+        """
+        Jump the simulation of the whole fleet forward in one step.
+
+        Args:
+            seconds: simulated time to advance by
+        """
+        self._fleet.advance_time(float(seconds))
+
+
+class Fleet(object):
+    """
+    Many Lm500 emulators, simulated together.
+
+    The data of channel c of device d is at index d * channel_count + c - 1 of the arrays value,
+    filling, fill_start (NaN when not filling) and fill_time, and the settings in FLEET_SETTINGS of
+    each device are repeated at the indexes of its channels. A channel is filling while it has a
+    fill_start.
+    """
+
+    def __init__(self, count, channel_count=2, **kwargs):
+        """
+        Args:
+            count: the number of devices
+            channel_count: number of level meter channels of each device
+            kwargs: passed on to each FleetLm500, e.g. override_initial_data
+        """
+        self.clock = SimulationClock()
+        self.channel_count = channel_count
+        size = count * channel_count
+        self.value = np.zeros(size)
+        self.filling = np.zeros(size, dtype=bool)
+        self.fill_start = np.full(size, np.nan)
+        self.fill_time = np.zeros(size, dtype=np.int64)
+        for name in FLEET_SETTINGS:
+            setattr(self, name, np.zeros(size))
+        # devices with measurements, history or events which may be due, handled one by one
+        self._active = set()
+        # devices with channels whose fill started or stopped in the last cycle
+        self._changed = set()
+        # devices which have not had a cycle yet
+        self._new = set()
+        self.devices = [FleetLm500(self, index, channel_count, **kwargs) for index in range(count)]
+        self._new.update(self.devices)
+        # the fill state machine of each channel, by its index in the arrays
+        self.channel_fills = [
+            channel_fill for device in self.devices for channel_fill in device.channel_fills
+        ]
+
+    def set_setting(self, index, name, value):
+        """
+        Args:
+            index: the number of the device in the fleet
+            name: the setting, one of FLEET_SETTINGS
+            value: its value
+        """
+        start = index * self.channel_count
+        getattr(self, name)[start : start + self.channel_count] = float(value)
+
+    def wake(self, device):
+        """
+        Handle a device one by one each cycle, until it has no measurements, history or events due.
+        """
+        self._active.add(device)
+
+    @staticmethod
+    def _is_active(device):
+        return (
+            not math.isinf(device.measurements.due)
+            or not math.isinf(device.history.next_sample)
+            or device.event_port is not None
+        )
+
+    def process(self, dt):
+        """
+        Take a simulation cycle of every device, as each device's own process would.
+
+        Args:
+            dt: simulated time since the last cycle
+        """
+        self.clock.advance(dt)
+        now = self.clock.time
+        active = list(self._active)
+        for device in active:
+            if now >= device.measurements.due:
+                device.measurements.step()
+
+        # a device's state machine follows its channels' filling as it was at the start of the
+        # cycle, so one whose fills started or stopped settles in the next cycle
+        filling = self.filling.reshape(-1, self.channel_count).any(axis=1)
+        changed = self._take_transitions(self._enter_new_devices())
+        for device in changed | self._changed:
+            # lewis has no way to set the state of a state machine other than by its transitions
+            device._csm._state = "filling" if filling[device._index] else "idle"
+        self._changed = changed
+        self._fill(dt, now)
+
+        for device in active:
+            device.doAfterProcess(dt)
+            if not self._is_active(device):
+                self._active.discard(device)
+
+    def _enter_new_devices(self):
+        """
+        Enter the initial state of the devices which have not had a cycle yet, as the first cycle
+        of lewis' state machine does, without checking any transitions.
+
+        Returns:
+            array of whether the transitions of each channel are checked this cycle, or None if
+            they all are
+        """
+        if not self._new:
+            return None
+        checked = np.ones(self.filling.size, dtype=bool)
+        for device in self._new:
+            # a device restored before its first cycle has had its state set
+            if device._csm.state is None:
+                device._csm._state = device._get_initial_state()
+                start = device._index * self.channel_count
+                checked[start : start + self.channel_count] = False
+        self._new.clear()
+        return checked
+
+    def _take_transitions(self, checked=None):
+        """
+        Start the fills requested and stop those which reached the high threshold or timed out.
+
+        Args:
+            checked: array of whether each channel's transitions are checked, or None for all
+
+        Returns:
+            set of the devices with channels whose fill started or stopped
+        """
+        idle = np.isnan(self.fill_start)
+        reached = self.value >= self.high_threshold
+        requested = idle & self.filling
+        if checked is not None:
+            requested &= checked
+        finished = ~idle & (reached | (self.fill_time > self.max_fill_time))
+        changed = set()
+        for index in np.flatnonzero(requested | finished):
+            channel_fill = self.channel_fills[index]
+            if finished[index]:
+                channel_fill.stop_fill()
+            elif reached[index]:
+                channel_fill.reset_fill()
+            else:
+                channel_fill.start_fill()
+            changed.add(channel_fill._context)
+        return changed
+
+    def _fill(self, dt, now):
+        """
+        Fill the channels which are filling for dt seconds, as approaches.linear does for each.
+        """
+        filling = np.flatnonzero(~np.isnan(self.fill_start))
+        if not filling.size:
+            return
+        current = self.value[filling]
+        target = self.high_threshold[filling]
+        sign = np.sign(target - current)
+        value = current + sign * self.fill_speed[filling] * dt
+        self.value[filling] = np.where(sign * value > sign * target, target, value)
+
+        fill_time = np.round((now - self.fill_start[filling]) / 60).astype(np.int64)
+        # fill progress is logged as the fill time changes
+        logged = filling[fill_time != self.fill_time[filling]]
+        self.fill_time[filling] = fill_time
+        for index in logged:
+            self.channel_fills[index].log_fill_progress()
+
+    def advance_time(self, seconds):
+        """
+        Jump the simulation of every device forward in one step.
+
+        Args:
+            seconds: simulated time to advance by
+        """
+        self.process(0)
+        self.process(seconds)
+        self.process(0)
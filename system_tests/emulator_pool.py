@@ -0,0 +1,254 @@
+"""
+A warm pool of Lm500 emulators, started ahead of time and reused, so that starting an emulator is
+paid for once a session rather than each time one is needed.
+
+Each emulator runs in a lewis process of its own, with a control server. acquire hands out an
+emulator which is ready, and release puts it back in its initial state with one backdoor call,
+to SimulatedLm500.reset, for the next to use. An emulator which fails to reset, which is logged,
+has stopped or has been used max_uses times is stopped and replaced by a new one, started in the
+background.
+
+The pool serves the benchmarks which start emulators with lewis, and only them. The IOC tests in
+tests/ cannot take emulators from it, as the IOC test framework starts each IOC's emulator itself,
+with the IOC, and the emulator tests run the emulator in their own process.
+
+Usage: python emulator_pool.py [--size N] [--uses N] [--cycle-delay D]
+    compares starting an emulator for each of --uses test classes with taking one from a pool
+"""
+
+import argparse
+import contextlib
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from emulator_process import EmulatorProcess, free_port
+from lewis.core.control_client import ControlClient, ProtocolException, RemoteException
+from lewis.core.logging import has_log
+
+# Seconds to wait for a new emulator's control server to answer
+CONTROL_TIMEOUT = 30
+
+
+class PooledEmulator(object):
+    """
+    An emulator of a pool, in a lewis process with a control server.
+    """
+
+    def __init__(self, cycle_delay=0.1):
+        """
+        Args:
+            cycle_delay: real time between simulation cycles, in seconds
+        """
+        self.process = EmulatorProcess(cycle_delay=cycle_delay, control_port=free_port())
+        self.uses = 0
+        self._client = None
+
+    @property
+    def port(self):
+        return self.process.port
+
+    @property
+    def control_port(self):
+        return self.process.control_port
+
+    def call(self, method, *args):
+        """
+        Call a method of the emulated device through lewis' control server. The proxies of
+        ControlClient.get_object are only freed by the garbage collector, and zmq hangs terminating
+        a context whose socket is left open for it, so requests are made with json_rpc, letting
+        the client go as soon as it is dropped.
+
+        Args:
+            method: name of the method, e.g. "reset"
+            args: its arguments
+
+        Returns:
+            what the method returns
+        """
+        if self._client is None:
+            self._client = ControlClient("127.0.0.1", str(self.control_port))
+        response, request_id = self._client.json_rpc(f"device.{method}", *args)
+        if response.get("id") != request_id:
+            raise ProtocolException(f"Reply to device.{method} does not match the request")
+        if "result" in response:
+            return response["result"]
+        error = response.get("error", {})
+        if "data" in error:
+            raise RemoteException(error["data"]["type"], error["data"]["message"])
+        raise ProtocolException(error.get("message", f"No result from device.{method}"))
+
+    def start(self):
+        """
+        Start the emulator and wait until it and its control server are ready.
+        """
+        self.process.start()
+        self.process.wait()
+        deadline = time.monotonic() + CONTROL_TIMEOUT
+        while True:
+            try:
+                self.reset()
+                return
+            except Exception:
+                if not self.process.running or time.monotonic() > deadline:
+                    self.stop()
+                    raise RuntimeError(f"Emulator control server on {self.control_port} failed")
+                time.sleep(0.1)
+
+    def reset(self):
+        self.call("reset")
+
+    def stop(self):
+        self.process.stop()
+        self._client = None
+
+
+@has_log
+class EmulatorPool(object):
+    """
+    Emulators kept running and ready to hand out.
+    """
+
+    def __init__(self, size=2, cycle_delay=0.1, max_uses=None):
+        """
+        Args:
+            size: the number of emulators kept running
+            cycle_delay: real time between simulation cycles of the emulators, in seconds
+            max_uses: times an emulator is handed out before it is replaced, or None for no limit
+        """
+        self.size = size
+        self.cycle_delay = cycle_delay
+        self.max_uses = max_uses
+        # emulators ready to hand out, or the errors of those which failed to start
+        self._ready = queue.Queue()
+        self._emulators = set()
+        self._lock = threading.Lock()
+        self._starter = None
+
+    def start(self):
+        """
+        Start the emulators in the background, returning at once.
+        """
+        self._starter = ThreadPoolExecutor(self.size)
+        for _ in range(self.size):
+            self._replace()
+
+    def close(self):
+        if self._starter is not None:
+            self._starter.shutdown(wait=True)
+            self._starter = None
+        with self._lock:
+            emulators, self._emulators = self._emulators, set()
+        for emulator in emulators:
+            emulator.stop()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _replace(self):
+        self._starter.submit(self._start_emulator)
+
+    def _start_emulator(self):
+        emulator = PooledEmulator(self.cycle_delay)
+        with self._lock:
+            self._emulators.add(emulator)
+        try:
+            emulator.start()
+        except Exception as error:
+            self._retire(emulator)
+            self._ready.put(error)
+        else:
+            self._ready.put(emulator)
+
+    def _retire(self, emulator):
+        with self._lock:
+            self._emulators.discard(emulator)
+        emulator.stop()
+
+    def acquire(self, timeout=60):
+        """
+        Take an emulator from the pool, waiting for one to be ready if none is.
+
+        Args:
+            timeout: the most seconds to wait
+
+        Returns:
+            the PooledEmulator, in its initial state
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            emulator = self._ready.get(timeout=max(0.0, deadline - time.monotonic()))
+            if isinstance(emulator, Exception):
+                self._replace()
+                raise emulator
+            if emulator.process.running:
+                emulator.uses += 1
+                return emulator
+            self._retire(emulator)
+            self._replace()
+
+    def release(self, emulator):
+        """
+        Put an emulator back in the pool, reset to its initial state, or replace it.
+
+        Args:
+            emulator: the PooledEmulator, as returned by acquire
+        """
+        if self.max_uses is None or emulator.uses < self.max_uses:
+            try:
+                emulator.reset()
+            except Exception as error:
+                self.log.error(
+                    "Replacing emulator on port %s, which failed to reset: %s", emulator.port, error
+                )
+            else:
+                self._ready.put(emulator)
+                return
+        self._retire(emulator)
+        self._replace()
+
+    @contextlib.contextmanager
+    def emulator(self, timeout=60):
+        """
+        Use an emulator from the pool, putting it back afterwards.
+        """
+        emulator = self.acquire(timeout)
+        try:
+            yield emulator
+        finally:
+            self.release(emulator)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--size", type=int, default=2, help="Emulators in the pool")
+    parser.add_argument("--uses", type=int, default=5, help="Test classes to start emulators for")
+    parser.add_argument("--cycle-delay", type=float, default=0.1, help="Simulation cycle, s")
+    args = parser.parse_args()
+
+    start = time.monotonic()
+    for _ in range(args.uses):
+        emulator = PooledEmulator(args.cycle_delay)
+        emulator.start()
+        emulator.stop()
+    cold = (time.monotonic() - start) / args.uses
+    print(f"Starting an emulator for each use: {cold * 1000:8.1f} ms a use")
+
+    with EmulatorPool(args.size, args.cycle_delay) as pool:
+        start = time.monotonic()
+        pool.release(pool.acquire())
+        print(f"Starting the pool of {args.size}:      {(time.monotonic() - start) * 1000:8.1f} ms")
+        start = time.monotonic()
+        for _ in range(args.uses):
+            pool.release(pool.acquire())
+        warm = (time.monotonic() - start) / args.uses
+        print(f"Taking one from the pool:          {warm * 1000:8.1f} ms a use")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Lm500 emulators run in processes of their own, for the benchmarks and the emulator pool.
+"""
+
+import os
+import socket
+import subprocess
+import sys
+import time
+
+SYSTEM_TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class EmulatorProcess(object):
+    """
+    Runs Lm500 emulators in a process listening on localhost, with lewis or with the asyncio
+    transport of emulator_server.
+    """
+
+    def __init__(
+        self,
+        port=None,
+        cycle_delay=0.1,
+        transport="lewis",
+        devices=1,
+        serial_options=(),
+        control_port=None,
+    ):
+        """
+        Args:
+            port: port of the first emulator, the others following it, or None for a free port
+            cycle_delay: real time between simulation cycles, in seconds
+            transport: "lewis" or "asyncio"
+            devices: number of emulators, more than one needs the asyncio transport
+            serial_options: serial line options of the asyncio transport, e.g. --baud-rate 9600
+            control_port: port of lewis' control server for the backdoor, if it should have one
+        """
+        if (devices > 1 or serial_options) and transport != "asyncio":
+            raise ValueError("lewis runs one emulator per process, without a serial line timing")
+        if control_port is not None and transport != "lewis":
+            raise ValueError("Only lewis has a control server")
+        self.port = port or free_port()
+        self.control_port = control_port
+        self.ports = list(range(self.port, self.port + devices))
+        self.cycle_delay = cycle_delay
+        self.transport = transport
+        self.devices = devices
+        self.serial_options = list(serial_options)
+        self._process = None
+
+    def _command(self):
+        if self.transport == "asyncio":
+            return [
+                "-m",
+                "emulator_server",
+                "--devices",
+                str(self.devices),
+                "--port",
+                str(self.port),
+                "--cycle-delay",
+                str(self.cycle_delay),
+            ] + self.serial_options
+        command = [
+            "-m",
+            "lewis",
+            "-a",
+            SYSTEM_TESTS_DIR,
+            "-k",
+            "lewis_emulators",
+            "-c",
+            str(self.cycle_delay),
+            "-o",
+            "error",
+            "-p",
+            f"stream: {{bind_address: 127.0.0.1, port: {self.port}}}",
+        ]
+        if self.control_port:
+            command += ["-r", f"127.0.0.1:{self.control_port}"]
+        return command + ["Lm500"]
+
+    @property
+    def running(self):
+        return self._process is not None and self._process.poll() is None
+
+    def start(self):
+        """
+        Start the process, without waiting for the emulators to be ready, see wait.
+        """
+        self._process = subprocess.Popen([sys.executable] + self._command(), cwd=SYSTEM_TESTS_DIR)
+
+    def wait(self, timeout=30):
+        """
+        Wait until the emulators are listening, stopping the process if they do not.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                socket.create_connection(("127.0.0.1", self.ports[-1]), timeout=1).close()
+                return
+            except OSError:
+                if self._process.poll() is not None or time.monotonic() > deadline:
+                    self.stop()
+                    raise RuntimeError(f"Emulator did not start listening on port {self.port}")
+                time.sleep(0.1)
+
+    def stop(self):
+        if self._process is not None:
+            self._process.terminate()
+            self._process.wait()
+            self._process = None
+
+    def __enter__(self):
+        self.start()
+        self.wait()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
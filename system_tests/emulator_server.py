@@ -0,0 +1,184 @@
+"""
+An asyncio transport for Lm500 emulators, as an alternative to running them with lewis.
+
+Serves any number of emulated devices, each on its own TCP port, to any number of client
+connections on one event loop. Requests are dispatched by each device's Lm500StreamInterface as
+soon as they arrive, rather than once per simulation cycle, and the devices are simulated on the
+same loop between requests. Replies wait for the devices' serial line timing without blocking
+the loop. There is no lewis control server, so no backdoor. With --fleet, the devices are
+simulated together as a Fleet, which needs NumPy.
+
+Usage: python emulator_server.py [--devices N] [--port P] [--cycle-delay D]
+    [--speed X] [--baud-rate B [--framing 8N1] [--processing-delay S] [--jitter S]] [--fleet]
+"""
+
+import argparse
+import asyncio
+import functools
+import time
+
+from lewis.core.logging import has_log
+from lewis_emulators.Lm500.device import SimulatedLm500
+from lewis_emulators.Lm500.interfaces import Lm500StreamInterface
+
+
+@has_log
+class AsyncStreamServer(object):
+    def __init__(
+        self,
+        devices,
+        host="127.0.0.1",
+        port=0,
+        cycle_delay=0.1,
+        speed=1.0,
+        serial_timing=None,
+        fleet=None,
+    ):
+        """
+        Args:
+            devices: the devices to serve
+            host: address to listen on
+            port: port of the first device, the others following it, or 0 for any free ports
+            cycle_delay: real time between simulation cycles, in seconds
+            speed: simulated time per real time
+            serial_timing: arguments of SimulatedLm500.set_serial_timing for every device, if any
+            fleet: the Fleet the devices are of, to simulate them together rather than one by one
+        """
+        self.interfaces = []
+        for device in devices:
+            if serial_timing is not None:
+                device.set_serial_timing(*serial_timing)
+            interface = Lm500StreamInterface()
+            interface.device = device
+            self.interfaces.append(interface)
+        self.host = host
+        self.port = port
+        self.cycle_delay = cycle_delay
+        self.speed = speed
+        self.fleet = fleet
+        self.ports = []
+        self.connections = 0
+        self._servers = []
+
+    async def start(self):
+        for number, interface in enumerate(self.interfaces):
+            server = await asyncio.start_server(
+                functools.partial(self._serve, interface),
+                self.host,
+                self.port + number if self.port else 0,
+            )
+            self._servers.append(server)
+            self.ports.append(server.sockets[0].getsockname()[1])
+        self.log.info("Serving %d device(s) on port(s) %s", len(self.interfaces), self.ports)
+
+    async def stop(self):
+        for server in self._servers:
+            server.close()
+            await server.wait_closed()
+        self._servers = []
+
+    async def run(self):
+        """
+        Serve the devices and simulate them until cancelled.
+        """
+        await self.start()
+        try:
+            await self._simulate()
+        finally:
+            await self.stop()
+
+    async def _simulate(self):
+        last = time.monotonic()
+        while True:
+            await asyncio.sleep(self.cycle_delay)
+            now = time.monotonic()
+            if self.fleet is not None:
+                self.fleet.process((now - last) * self.speed)
+            else:
+                for interface in self.interfaces:
+                    interface.device.process((now - last) * self.speed)
+            last = now
+
+    async def _serve(self, interface, reader, writer):
+        in_terminator = interface.in_terminator.encode()
+        out_terminator = interface.out_terminator.encode()
+        self.connections += 1
+        try:
+            while True:
+                request = (await reader.readuntil(in_terminator))[: -len(in_terminator)]
+                reply = self.handle(interface, request)
+                delay = interface.serial_delay(request, reply)
+                if delay:
+                    await asyncio.sleep(delay)
+                if reply is not None:
+                    writer.write(str(reply).encode() + out_terminator)
+                    await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            pass
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    @staticmethod
+    def handle(interface, request):
+        """
+        Process a request as the lewis stream adapter does.
+
+        Args:
+            interface: the device's interface
+            request: requested bytes
+
+        Returns:
+            the reply, or None if there is none
+        """
+        try:
+            return interface.handle_request(request)
+        except Exception as error:
+            return interface.handle_error(request, error)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--devices", type=int, default=1, help="Emulated devices")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on")
+    parser.add_argument(
+        "--port", type=int, default=57677, help="Port of the first device, the others following"
+    )
+    parser.add_argument("--cycle-delay", type=float, default=0.1, help="Simulation cycle, s")
+    parser.add_argument("--speed", type=float, default=1.0, help="Simulated time per real time")
+    parser.add_argument(
+        "--baud-rate", type=float, default=0, help="Serial line baud rate, 0 to reply instantly"
+    )
+    parser.add_argument("--framing", default="8N1", help="Serial line character framing")
+    parser.add_argument(
+        "--processing-delay", type=float, default=0.0, help="Time to process a command, s"
+    )
+    parser.add_argument("--jitter", type=float, default=0.0, help="Most random extra time, s")
+    parser.add_argument(
+        "--fleet", action="store_true", help="Simulate the devices together, needs NumPy"
+    )
+    args = parser.parse_args()
+
+    fleet = None
+    if args.fleet:
+        # NumPy is only needed for a fleet
+        from emulator_fleet import Fleet
+
+        fleet = Fleet(args.devices)
+    server = AsyncStreamServer(
+        fleet.devices if fleet else [SimulatedLm500() for _ in range(args.devices)],
+        args.host,
+        args.port,
+        args.cycle_delay,
+        args.speed,
+        (args.baud_rate, args.framing, args.processing_delay, args.jitter),
+        fleet,
+    )
+    try:
+        asyncio.run(server.run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+# Bits of a channel's status
+READ_IN_PROGRESS = 0x01
+REFILL_ACTIVE = 0x02
+REFILL_TIMEOUT = 0x04
+REFILL_INHIBITED = 0x08
+ALARM_LIMIT = 0x10
+OPEN_SENSOR = 0x20
+BURNOUT = 0x40
+
+
+class Lm500Channel(object):
+    """
+    The data of a single level meter channel.
+    """
+
+    __slots__ = (
+        "number",
+        "type",
+        "measurement",
+        "measured",
+        "value",
+        "filling",
+        "fill_start",
+        "fill_time",
+        "fill_status",
+        "read_until",
+        "status",
+    )
+
+    def __init__(self, number, sensor_type=0):
+        """
+        Args:
+            number: the channel number, starting from 1
+            sensor_type: 0 for a helium sensor, 1 for nitrogen
+        """
+        self.number = number
+        self.type = sensor_type
+        self.measurement = 0
+        # whether the channel has been measured, as its alarm limit bit is clear until it has
+        self.measured = False
+        self.value = 0.0
+        self.filling = False
+        self.fill_start = None
+        self.fill_time = 0
+        self.fill_status = "Off"
+        # when the measurement in progress ends, in simulated time, or None if none is
+        self.read_until = None
+        # the status bits, kept up to date by the device as the channel's state changes
+        self.status = 0
@@ -0,0 +1,11 @@
+class SimulationClock(object):
+    """
+    Time seen by the simulated device, in seconds. It is advanced by each simulation cycle, so it
+    follows the speed of the lewis simulation rather than the wall clock.
+    """
+
+    def __init__(self, start=0.0):
+        self.time = float(start)
+
+    def advance(self, seconds):
+        self.time += seconds
@@ -1,117 +1,584 @@
+import math
+import time
 from collections import OrderedDict
 
 from lewis.core.logging import has_log
 from lewis.core.statemachine import State
 from lewis.devices import StateMachineDevice
 
-from .states import FillingBothState, FillingChan1State, FillingChan2State
+from .channel import ALARM_LIMIT, Lm500Channel
+from .clock import SimulationClock
+from .events import EventPublisher
+from .history import History
+from .measurements import MeasurementModel, MeasurementScheduler, interval_seconds
+from .metrics import Metrics
+from .serial_line import SerialLine
+from .states import CHANNEL_FILLING, ChannelFill, FillingState
+
+# Settings of the device, published to event subscribers and saved by snapshot
+SETTINGS = (
+    "alarm_threshold",
+    "analog_out",
+    "boost_mode",
+    "channel",
+    "error_response_mode",
+    "fill_speed",
+    "high_threshold",
+    "low_threshold",
+    "max_fill_time",
+    "measurement_duration",
+    "sample_interval",
+    "sample_mode",
+    "sensor_length",
+    "status",
+    "units",
+)
+CHANNEL_DATA = tuple(slot for slot in Lm500Channel.__slots__ if slot != "number")
+
+
+def _reply_setting(name):
+    """
+    A setting of the device which cached replies depend on, so that setting it clears them.
+    """
+    attribute = "_" + name
+
+    def set_setting(self, value):
+        setattr(self, attribute, value)
+        self.replies.clear()
+
+    return property(lambda self: getattr(self, attribute), set_setting)
 
 
 @has_log
 class SimulatedLm500(StateMachineDevice):
+    channel = _reply_setting("channel")
+    low_threshold = _reply_setting("low_threshold")
+    sensor_length = _reply_setting("sensor_length")
+    units = _reply_setting("units")
+
+    def __init__(self, channel_count=2, **kwargs):
+        """
+        Args:
+            channel_count: number of level meter channels, 2 for the LM-500
+            kwargs: passed on to StateMachineDevice
+        """
+        self.channel_count = channel_count
+        super(SimulatedLm500, self).__init__(**kwargs)
+        # What reset restores
+        self._initial_snapshot = self.snapshot()
+
     def _initialize_data(self):
+        # Replies to queries of the settings, by request, cleared whenever a setting changes
+        self.replies = {}
+        # Transitions are only checked in a cycle after something they depend on has changed
+        self._dirty = True
+        self._check_transitions = False
+        self.clock = SimulationClock()
+        self.channels = [self._new_channel(number) for number in range(1, self.channel_count + 1)]
+        # The status reply, made from the channels' status bits when any have changed since
+        self._status = None
+        self._menu_mode = 0
+        # Measurements are taken on their own as the sample mode and interval say, each taking
+        # measurement_duration seconds plus the time the measurement model gives for the sensor's
+        # type and length, or none at all if that is 0
+        self.measurements = MeasurementScheduler(self)
+        self.measurement_duration = 0.0
+        # Measurements are instant and exact until set_measurement_model sets the sensors' timing
+        self.measurement_model = MeasurementModel()
+        # Samples of the state and channels, taken once set_history has set an interval
+        self.history = History(self)
         self.alarm_threshold = "10"
         self.boost_mode = "Off"
         self.analog_out = 0
-        self.type = {1: 1, 2: 0}
         self.channel = 1
         self.error_response_mode = 0
         self.high_threshold = 10
         self.low_threshold = 0
+        self.sample_mode = "Sample/Hold"
         self.sample_interval = "00:00:00"
         self.sensor_length = 0
-        self.measurement = {1: 0, 2: 0}
-        self.value = {1: 0, 2: 0}
-        self.fill_time = {1: 0, 2: 0}
-        self.fill_start = {1: 0, 2: 0}
-        self.sample_mode = "Sample/Hold"
         self.units = "CM"
-        self.status = "0,0,0"
-        self.filling = {1: False, 2: False}
         self.fill_speed = 1.0
         self.max_fill_time = 1
-        self.fill_status_val = {1: "Off", 2: "Off"}
+        # Each channel has its own fill state machine, stepped in turn while any are filling
+        self.channel_fills = [ChannelFill(self, channel) for channel in self.channels]
+        # Fill progress is logged when a channel's fill time changes, or every fill_log_interval
+        # seconds of simulated time, while fill_logging is enabled
+        self.fill_logging = True
+        self.fill_log_interval = 10.0
+        # Counts and latencies of commands and simulation cycles, read via command_metrics,
+        # cycle_metrics and handled_errors while metrics_enabled
+        self.metrics = Metrics()
+        self._cycle_start = None
+        # Replies are instant until a serial line timing is set with set_serial_timing
+        self.serial_line = SerialLine()
+        # Changes are pushed to subscribers once start_events has been called
+        self.events = EventPublisher()
+
+    def _new_channel(self, number):
+        """
+        Args:
+            number: the channel number, starting from 1
+
+        Returns:
+            the data of the channel, channel 1 being a nitrogen sensor and the others helium
+        """
+        return Lm500Channel(number, sensor_type=1 if number == 1 else 0)
 
     def _get_state_handlers(self):
         return {
             "idle": State(),
-            "chan1": FillingChan1State(),
-            "chan2": FillingChan2State(),
-            "both": FillingBothState(),
+            "filling": FillingState(),
         }
 
     def _get_initial_state(self):
         return "idle"
 
     def _get_transition_handlers(self):
-        return OrderedDict(
+        transitions = OrderedDict(
             [
+                (("idle", "filling"), lambda: any(channel.filling for channel in self.channels)),
                 (
-                    ("idle", "chan1"),
-                    lambda: self.filling[1] is True and self.value[1] < self.high_threshold,
-                ),
-                (
-                    ("chan1", "idle"),
-                    lambda: self.value[1] == self.high_threshold
-                    or self.fill_time[1] > self.max_fill_time,
-                ),
-                (
-                    ("idle", "chan2"),
-                    lambda: self.filling[2] is True
-                    and self.value[2] < self.high_threshold
-                    and self.fill_time[2] < self.max_fill_time,
-                ),
-                (
-                    ("chan2", "idle"),
-                    lambda: self.value[2] == self.high_threshold
-                    or self.fill_time[2] > self.max_fill_time,
-                ),
-                (
-                    ("chan1", "both"),
-                    lambda: self.filling[2] is True
-                    and self.value[2] < self.high_threshold
-                    and self.fill_time[2] < self.max_fill_time,
-                ),
-                (
-                    ("chan2", "both"),
-                    lambda: self.filling[1] is True
-                    and self.value[1] < self.high_threshold
-                    and self.fill_time[1] < self.max_fill_time,
-                ),
-                (
-                    ("both", "idle"),
-                    lambda: self.value[1] == self.high_threshold
-                    and self.value[2] == self.high_threshold
-                    or (
-                        self.fill_time[1] > self.max_fill_time
-                        and self.fill_time[2] > self.max_fill_time
-                    ),
-                ),
-                (
-                    ("both", "chan1"),
-                    lambda: self.value[2] == self.high_threshold
-                    or self.fill_time[2] > self.max_fill_time,
-                ),
-                (
-                    ("both", "chan2"),
-                    lambda: self.value[1] == self.high_threshold
-                    or self.fill_time[1] > self.max_fill_time,
+                    ("filling", "idle"),
+                    lambda: not any(channel.filling for channel in self.channels),
                 ),
             ]
         )
+        return OrderedDict(
+            (states, self._when_dirty(condition)) for states, condition in transitions.items()
+        )
+
+    def _when_dirty(self, condition):
+        return lambda: self._check_transitions and condition()
 
     @property
     def state(self):
-        return self._csm.state
+        """
+        The channels being filled, named as "idle", "chan1", "chan2" or "both" for two channels.
+        """
+        filling = [
+            channel_fill.channel.number
+            for channel_fill in self.channel_fills
+            if channel_fill.state == CHANNEL_FILLING
+        ]
+        if not filling:
+            return "idle"
+        if len(filling) == 2 == self.channel_count:
+            return "both"
+        return ",".join(f"chan{channel}" for channel in filling)
+
+    @property
+    def alarm_threshold(self):
+        return self._alarm_threshold
+
+    @alarm_threshold.setter
+    def alarm_threshold(self, threshold):
+        self._alarm_threshold = threshold
+        self.replies.clear()
+        for channel in self.channels:
+            self.update_alarm(channel)
+
+    @property
+    def status(self):
+        """
+        The status of each channel, as the sum of its status bits, then the menu mode, e.g.
+        "18,0,0" for channel 1 filling below its alarm limit. Setting it sets the status bits,
+        until the state of the channels changes them.
+        """
+        if self._status is None:
+            fields = [str(channel.status) for channel in self.channels]
+            self._status = ",".join(fields + [str(self._menu_mode)])
+        return self._status
+
+    @status.setter
+    def status(self, status):
+        fields = [int(field) for field in str(status).split(",")]
+        if len(fields) != len(self.channels) + 1:
+            raise ValueError(f"Expected a status for each channel and the menu mode: {status}")
+        for channel, bits in zip(self.channels, fields):
+            channel.status = bits
+        self._menu_mode = fields[-1]
+        self._status = None
+
+    def set_status_bit(self, channel, bit, value):
+        """
+        Args:
+            channel: the data of the channel
+            bit: the status bit, e.g. REFILL_ACTIVE
+            value: whether the bit is set
+        """
+        status = channel.status | bit if value else channel.status & ~bit
+        if status != channel.status:
+            channel.status = status
+            self._status = None
+
+    def update_alarm(self, channel):
+        """
+        Set the alarm limit bit of a channel if its measured level is below the alarm threshold.
+        A channel which has not been measured yet has no level to alarm on.
+
+        Args:
+            channel: the data of the channel
+        """
+        self.set_status_bit(
+            channel,
+            ALARM_LIMIT,
+            channel.measured and channel.measurement < float(self.alarm_threshold),
+        )
+
+    @property
+    def high_threshold(self):
+        return self._high_threshold
+
+    @high_threshold.setter
+    def high_threshold(self, threshold):
+        self._high_threshold = threshold
+        self.replies.clear()
+        self.mark_dirty()
+
+    @property
+    def sample_mode(self):
+        return self._sample_mode
+
+    @sample_mode.setter
+    def sample_mode(self, mode):
+        self._sample_mode = mode
+        self.replies.clear()
+        self.measurements.schedule(mode, self.measurements.period)
+
+    @property
+    def sample_interval(self):
+        return self._sample_interval
+
+    @sample_interval.setter
+    def sample_interval(self, interval):
+        period = interval_seconds(interval)
+        self._sample_interval = interval
+        self.replies.clear()
+        self.measurements.schedule(self.sample_mode, period)
+
+    @property
+    def max_fill_time(self):
+        return self._max_fill_time
+
+    @max_fill_time.setter
+    def max_fill_time(self, max_fill_time):
+        self._max_fill_time = max_fill_time
+        self.mark_dirty()
+
+    def mark_dirty(self):
+        """
+        Flag that the state transitions need checking in the next simulation cycle.
+        """
+        self._dirty = True
+
+    def invalidate_replies(self):
+        """
+        Clear the cached replies, for a change which they may depend on other than of a setting.
+        """
+        self.replies.clear()
+
+    def doBeforeProcess(self, dt):
+        if self.metrics.enabled:
+            self._cycle_start = time.perf_counter()
+        self.clock.advance(dt)
+        if self.clock.time >= self.measurements.due:
+            self.measurements.step()
+        # The state machine's first cycle only enters the initial state, without checking any
+        # transitions, so what has changed is kept for the cycle after
+        if self._csm.state is None:
+            self._check_transitions = False
+        else:
+            self._check_transitions = self._dirty
+            self._dirty = False
+
+    def doProcess(self, dt):
+        # An idle device where nothing has changed has nothing to simulate
+        if self._check_transitions or self._csm.state != "idle":
+            super(SimulatedLm500, self).doProcess(dt)
+
+    def doAfterProcess(self, dt):
+        if self.clock.time >= self.history.next_sample:
+            self.history.record()
+        if self.events.subscribed:
+            self.events.publish(self.event_values(), self.clock.time)
+        if self.metrics.enabled and self._cycle_start is not None:
+            self.metrics.cycles.add(time.perf_counter() - self._cycle_start)
+
+    @property
+    def command_metrics(self):
+        """
+        Count, errors, mean and maximum latency and latency histogram of each command keyword, with
+        commands which were not recognised under "unrecognised".
+        """
+        return self.metrics.command_dicts()
+
+    @property
+    def cycle_metrics(self):
+        """
+        Count, mean and maximum duration and duration histogram of the simulation cycles, including
+        the state transitions and the current state's in_state.
+        """
+        return self.metrics.cycles.as_dict()
+
+    @property
+    def handled_errors(self):
+        """
+        The number of requests which got no reply because of an error.
+        """
+        return self.metrics.handled_errors
+
+    @property
+    def metrics_enabled(self):
+        return self.metrics.enabled
+
+    @metrics_enabled.setter
+    def metrics_enabled(self, enabled):
+        self.metrics.enabled = enabled
+
+    def reset_metrics(self):
+        self.metrics.reset()
+
+    @property
+    def serial_timing(self):
+        line = self.serial_line
+        return {
+            "baud_rate": line.baud_rate,
+            "framing": line.framing,
+            "processing_delay": line.processing_delay,
+            "jitter": line.jitter,
+        }
+
+    def set_serial_timing(self, baud_rate, framing="8N1", processing_delay=0.0, jitter=0.0):
+        """
+        Make replies take as long as they would on a serial line, e.g. (9600, "8N1", 0.05) for an
+        LM-500 taking 50 ms to process each command.
+
+        Args:
+            baud_rate: bits per second, or 0 to reply instantly
+            framing: data bits, parity (N, O, E, M or S) and stop bits
+            processing_delay: time the device takes to process a command, in seconds
+            jitter: the most random extra time a transaction can take, in seconds
+        """
+        self.serial_line.configure(
+            float(baud_rate), framing, float(processing_delay), float(jitter)
+        )
+
+    def measurement_time(self, channel):
+        """
+        Args:
+            channel: the data of the channel
+
+        Returns:
+            seconds of simulated time measuring the channel takes
+        """
+        return self.measurement_model.duration(
+            channel, self.measurement_duration, self.sensor_length
+        )
+
+    @property
+    def measurement_settings(self):
+        model = self.measurement_model
+        return {
+            "helium_seconds_per_length": model.helium_seconds_per_length,
+            "nitrogen_seconds_per_length": model.nitrogen_seconds_per_length,
+            "noise": model.noise,
+            "boil_off_rate": model.boil_off_rate,
+            "seed": model.seed,
+        }
+
+    def set_measurement_model(
+        self,
+        helium_seconds_per_length=0.0,
+        nitrogen_seconds_per_length=0.0,
+        noise=0.0,
+        boil_off_rate=0.0,
+        seed=None,
+    ):
+        """
+        Make measurements take time for the length of the sensor, on top of measurement_duration,
+        and read the level with noise, e.g. (0.1, 0, 0.2, 0.05) for a helium sensor taking 0.1 s
+        per unit of length, read to within about 0.2 and boiling off 0.05 a second while read.
+
+        Args:
+            helium_seconds_per_length: time to measure a helium sensor, per unit of its length
+            nitrogen_seconds_per_length: time to measure a nitrogen sensor, per unit of its length
+            noise: standard deviation of the readings from the level, in the units
+            boil_off_rate: fall of the level of a helium channel per second of its measurement
+            seed: seed of the noise, for readings which are the same each run, or None
+        """
+        self.measurement_model.configure(
+            float(helium_seconds_per_length),
+            float(nitrogen_seconds_per_length),
+            float(noise),
+            float(boil_off_rate),
+            None if seed is None else int(seed),
+        )
+
+    def start_events(self, port=0):
+        """
+        Push changes of the device's state, settings and channels' data to subscribers, e.g. an
+        EventSubscription, connecting to a TCP port. Changes are published at the end of each
+        simulation cycle, so one made by a command or the backdoor is published by the next.
+
+        Args:
+            port: the port to listen on, or 0 for any free port
+
+        Returns:
+            the port subscribers connect to, also given by event_port
+        """
+        return self.events.start(port=int(port))
+
+    def stop_events(self):
+        self.events.stop()
+
+    @property
+    def event_port(self):
+        return self.events.port
+
+    def event_values(self):
+        """
+        Returns:
+            dictionary of the values published to event subscribers, with the channels' data
+            named by channel, e.g. "chan1.fill_status"
+        """
+        values = {name: getattr(self, name) for name in SETTINGS}
+        values["state"] = self.state
+        for channel in self.channels:
+            prefix = f"chan{channel.number}."
+            for name in CHANNEL_DATA:
+                values[prefix + name] = getattr(channel, name)
+        return values
+
+    def snapshot(self):
+        """
+        Returns:
+            the whole state of the device, including its state machine and simulated time, as a
+            dictionary which can be sent through the backdoor and passed to restore
+        """
+        return {
+            "settings": {name: getattr(self, name) for name in SETTINGS},
+            "channels": [
+                dict(
+                    {name: getattr(channel_fill.channel, name) for name in CHANNEL_DATA},
+                    fill_state=channel_fill.state,
+                )
+                for channel_fill in self.channel_fills
+            ],
+            # the initial state before the state machine's first cycle has entered it
+            "state": self._csm.state or self._get_initial_state(),
+            "time": self.clock.time,
+            "next_sample": (
+                None if math.isinf(self.measurements.next_sample) else self.measurements.next_sample
+            ),
+            "fill_logging": self.fill_logging,
+            "fill_log_interval": self.fill_log_interval,
+            "serial_timing": self.serial_timing,
+            "measurement_settings": self.measurement_settings,
+        }
+
+    def restore(self, snapshot):
+        """
+        Put the device back in a state saved by snapshot, all at once.
+
+        Args:
+            snapshot: the state to restore, as returned by snapshot
+        """
+        if len(snapshot["channels"]) != len(self.channel_fills):
+            raise ValueError(
+                f"Snapshot of {len(snapshot['channels'])} channels, device has "
+                f"{len(self.channel_fills)}"
+            )
+        self.clock.time = float(snapshot["time"])
+        for name, value in snapshot["settings"].items():
+            setattr(self, name, value)
+        for channel_fill, data in zip(self.channel_fills, snapshot["channels"]):
+            channel_fill.state = data["fill_state"]
+            channel_fill._last_logged = None
+            for name in CHANNEL_DATA:
+                setattr(channel_fill.channel, name, data[name])
+        self._status = None
+        # lewis has no way to set the state of a state machine other than by its transitions
+        self._csm._state = snapshot["state"] or self._get_initial_state()
+        next_sample = snapshot["next_sample"]
+        self.measurements.next_sample = math.inf if next_sample is None else next_sample
+        self.measurements.update_due()
+        self.fill_logging = snapshot["fill_logging"]
+        self.fill_log_interval = snapshot["fill_log_interval"]
+        self.set_serial_timing(**snapshot["serial_timing"])
+        self.set_measurement_model(**snapshot["measurement_settings"])
+        self.serial_line.busy_until = 0.0
+        self.invalidate_replies()
+        self.mark_dirty()
+        # the history is of the simulated time before, which may be later than that restored
+        self.history.clear()
+
+    def reset(self):
+        """
+        Put the device back in its initial state in one call, e.g. before each test.
+        """
+        self.restore(self._initial_snapshot)
+
+    def set_history(self, interval, capacity=3600):
+        """
+        Record the state and each channel's level, measurement and filling every interval seconds
+        of simulated time, keeping the latest capacity samples, e.g. (1, 3600) for the last hour.
+
+        Args:
+            interval: simulated seconds between samples, or 0 to stop recording
+            capacity: the most samples kept
+        """
+        self.history.configure(float(interval), int(capacity))
+
+    def history_windows(self, start=None, end=None, count=100):
+        """
+        The history downsampled into windows of equal simulated time, with the minimum, maximum
+        and mean of the samples in each, and the state at the end of each.
+
+        Args:
+            start: simulated time to start from, the oldest sample if None
+            end: simulated time to end at, the newest sample if None
+            count: the number of windows
+
+        Returns:
+            list of dictionaries, one for each window with samples in it
+        """
+        return self.history.windows(start, end, int(count))
+
+    def advance_time(self, seconds):
+        """
+        Jump the simulation forward in one step, e.g. to reach a fill timeout without waiting.
+
+        Args:
+            seconds: simulated time to advance by
+        """
+        # Take any pending transitions first, then settle the state after the jump
+        self.process(0)
+        self.process(float(seconds))
+        self.process(0)
+
+    def channel_data(self, channel):
+        """
+        Args:
+            channel: the channel number, starting from 1
+
+        Returns:
+            the data of the channel
+        """
+        if not 1 <= channel <= len(self.channels):
+            raise ValueError(f"No such channel: {channel}")
+        return self.channels[channel - 1]
 
     def fill(self, channel):
-        self.filling[channel] = True
+        self.channel_data(channel).filling = True
+        self.mark_dirty()
 
     def fill_status(self, channel):
-        if self.filling[channel]:
-            return f"{self.fill_time[channel]} min"
+        data = self.channel_data(channel)
+        if data.filling:
+            return f"{data.fill_time} min"
         else:
-            return self.fill_status_val[channel]
+            return data.fill_status
 
     def get_alarm_threshold(self):
         return f"{self.alarm_threshold} {self.units}"
@@ -126,7 +593,7 @@ class SimulatedLm500(StateMachineDevice):
         return f"{self.sensor_length} {self.units}"
 
     def get_measurement(self, channel):
-        return f"{self.measurement[channel]} {self.units}"
+        return f"{self.channel_data(channel).measurement} {self.units}"
 
     def set_measurement(self, channel):
-        self.measurement[channel] = self.value[channel]
+        self.measurements.start(self.channel_data(channel))
@@ -0,0 +1,261 @@
+"""
+Notifications of changes to the emulated device, pushed to subscribers over TCP so that tests can
+wait for the change they expect rather than poll for it.
+
+Each subscriber is sent JSON lines. The first is a snapshot of all the values, then each value
+which changes is sent as it changes:
+
+    {"seq": 1, "time": 0.0, "kind": "snapshot", "values": {"state": "idle", ...}}
+    {"seq": 2, "time": 1.5, "kind": "change", "name": "state", "value": "chan1", "old": "idle"}
+
+where seq counts the events from the device and time is the device's simulated time.
+"""
+
+import json
+import queue
+import socket
+import threading
+import time
+
+from lewis.core.logging import has_log
+
+# Events waiting to be sent to a subscriber, beyond which it is too slow and is disconnected
+SUBSCRIBER_QUEUE_SIZE = 10000
+
+
+class _Subscriber(object):
+    """
+    A connection to a subscriber, sent the events queued for it from a thread of its own so that
+    publishing never waits for the network.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.events = queue.Queue(SUBSCRIBER_QUEUE_SIZE)
+        self.connected = True
+        threading.Thread(target=self._send, daemon=True).start()
+
+    def put(self, event):
+        try:
+            self.events.put_nowait(event)
+        except queue.Full:
+            self.close()
+
+    def close(self):
+        if self.connected:
+            self.connected = False
+            # wakes the sending thread, which closes the connection
+            try:
+                self.events.put_nowait(None)
+            except queue.Full:
+                self.connection.close()
+
+    def _send(self):
+        try:
+            while True:
+                event = self.events.get()
+                if event is None or not self.connected:
+                    break
+                self.connection.sendall(json.dumps(event).encode() + b"\n")
+        except OSError:
+            pass
+        finally:
+            self.connected = False
+            self.connection.close()
+
+
+@has_log
+class EventPublisher(object):
+    """
+    Publishes changes to the device's values to the subscribers connected to its server. Values
+    are compared with those last published only while someone is subscribed.
+    """
+
+    def __init__(self):
+        self.sequence = 0
+        self.port = None
+        self._server = None
+        self._subscribers = []
+        # subscribers who have not been sent a snapshot yet
+        self._new_subscribers = []
+        self._values = {}
+        self._lock = threading.Lock()
+
+    @property
+    def subscribed(self):
+        return bool(self._subscribers or self._new_subscribers)
+
+    @property
+    def subscriber_count(self):
+        with self._lock:
+            self._subscribers = [
+                subscriber for subscriber in self._subscribers if subscriber.connected
+            ]
+            return len(self._subscribers) + len(self._new_subscribers)
+
+    def start(self, host="127.0.0.1", port=0):
+        """
+        Start the server which subscribers connect to, unless it is running already.
+
+        Args:
+            host: address to listen on
+            port: port to listen on, or 0 for any free port
+
+        Returns:
+            the port the server listens on
+        """
+        if self._server is None:
+            self._server = socket.create_server((host, port))
+            self.port = self._server.getsockname()[1]
+            threading.Thread(target=self._accept, args=(self._server,), daemon=True).start()
+            self.log.info("Publishing device events on port %d", self.port)
+        return self.port
+
+    def stop(self):
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+            self.port = None
+        with self._lock:
+            for subscriber in self._subscribers + self._new_subscribers:
+                subscriber.close()
+            self._subscribers = []
+            self._new_subscribers = []
+
+    def _accept(self, server):
+        while True:
+            try:
+                connection, _ = server.accept()
+            except OSError:
+                break
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            with self._lock:
+                self._new_subscribers.append(_Subscriber(connection))
+
+    def publish(self, values, simulated_time):
+        """
+        Send the subscribers the values which changed since they were last published, and new
+        subscribers all of them.
+
+        Args:
+            values: dictionary of the device's current values by name
+            simulated_time: the device's simulated time
+        """
+        with self._lock:
+            if self._subscribers:
+                for name, value in values.items():
+                    old = self._values.get(name)
+                    if value != old:
+                        self.sequence += 1
+                        event = {
+                            "seq": self.sequence,
+                            "time": simulated_time,
+                            "kind": "change",
+                            "name": name,
+                            "value": value,
+                            "old": old,
+                        }
+                        for subscriber in self._subscribers:
+                            subscriber.put(event)
+                self._subscribers = [
+                    subscriber for subscriber in self._subscribers if subscriber.connected
+                ]
+
+            if self._new_subscribers:
+                self.sequence += 1
+                snapshot = {
+                    "seq": self.sequence,
+                    "time": simulated_time,
+                    "kind": "snapshot",
+                    "values": values,
+                }
+                for subscriber in self._new_subscribers:
+                    subscriber.put(snapshot)
+                self._subscribers.extend(self._new_subscribers)
+                self._new_subscribers = []
+
+            self._values = values
+
+
+class EventSubscription(object):
+    """
+    A subscriber to the events of an emulated device, keeping track of its values.
+    """
+
+    def __init__(self, port, host="127.0.0.1", timeout=10.0):
+        """
+        Args:
+            port: the port the device publishes its events on, see SimulatedLm500.start_events
+            host: the address of the emulator
+            timeout: seconds to wait for the snapshot of the device's values
+        """
+        self.values = {}
+        self.events = []
+        self._socket = socket.create_connection((host, port), timeout)
+        self._buffer = b""
+        self.wait_for(lambda event: event["kind"] == "snapshot", timeout)
+
+    def close(self):
+        self._socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def _receive(self, timeout):
+        while b"\n" not in self._buffer:
+            self._socket.settimeout(timeout)
+            data = self._socket.recv(65536)
+            if not data:
+                raise ConnectionError("The device closed the subscription")
+            self._buffer += data
+        line, self._buffer = self._buffer.split(b"\n", 1)
+        event = json.loads(line)
+        if event["kind"] == "snapshot":
+            self.values.update(event["values"])
+        else:
+            self.values[event["name"]] = event["value"]
+        self.events.append(event)
+        return event
+
+    def wait_for(self, condition, timeout=10.0):
+        """
+        Wait for an event.
+
+        Args:
+            condition: function of an event returning whether it is the one to wait for
+            timeout: the most seconds to wait
+
+        Returns:
+            the event
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise AssertionError(f"Timed out after {timeout} s waiting for a device event")
+            try:
+                event = self._receive(remaining)
+            except socket.timeout:
+                continue
+            if condition(event):
+                return event
+
+    def wait_for_value(self, name, value, timeout=10.0):
+        """
+        Wait until a value of the device is as expected, returning at once if it already is.
+
+        Args:
+            name: the name of the value, e.g. "state" or "chan1.fill_status"
+            value: the value to wait for
+            timeout: the most seconds to wait
+        """
+        if self.values.get(name) != value:
+            self.wait_for(
+                lambda event: (
+                    event["kind"] == "change" and event["name"] == name and event["value"] == value
+                ),
+                timeout,
+            )
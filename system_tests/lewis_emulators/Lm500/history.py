@@ -0,0 +1,215 @@
+import bisect
+import math
+from array import array
+
+# States of the device's state machine, recorded by their index
+STATE_NAMES = ("idle", "filling")
+
+# Samples whose minimum, maximum and sum are kept together, so that windows of many samples can
+# be summarised from these rather than from each sample
+BLOCK = 64
+
+
+class _Times(object):
+    """
+    The sample times of a History in the order they were taken, for bisect.
+    """
+
+    def __init__(self, history):
+        self._history = history
+
+    def __len__(self):
+        return self._history.size
+
+    def __getitem__(self, index):
+        return self._history.column("time", index)
+
+
+class History(object):
+    """
+    The recent history of the device's state and channels, sampled every interval seconds of
+    simulated time into ring buffers of a fixed capacity, so that it takes the same memory however
+    long the device runs. Nothing is recorded until it is configured with an interval.
+
+    The minimum, maximum and sum of each block of BLOCK samples are kept up to date as samples are
+    taken, so that summarising the history takes little time, however many samples there are.
+    """
+
+    def __init__(self, context):
+        """
+        Args:
+            context: the device
+        """
+        self._context = context
+        self.names = ["time", "state"]
+        for channel in context.channels:
+            self.names.extend(
+                f"chan{channel.number}.{name}" for name in ("value", "measurement", "filling")
+            )
+        self.interval = 0.0
+        self.capacity = 0
+        self._columns = {}
+        # the minimums, maximums and sums of the blocks of each column
+        self._blocks = {}
+        self.clear()
+
+    def configure(self, interval, capacity):
+        """
+        Args:
+            interval: simulated seconds between samples, or 0 to stop recording
+            capacity: the most samples kept, the oldest being overwritten
+        """
+        if interval < 0 or capacity < 1:
+            raise ValueError("The interval cannot be negative and the capacity must be positive")
+        self.interval = float(interval)
+        # the capacity is a whole number of blocks
+        capacity = -(-int(capacity) // BLOCK) * BLOCK
+        if capacity != self.capacity:
+            self.capacity = capacity
+            self._columns = {name: array("d", bytes(8 * capacity)) for name in self.names}
+            self._blocks = {
+                name: tuple(array("d", bytes(8 * (capacity // BLOCK))) for _ in range(3))
+                for name in self.names
+            }
+        self.clear()
+
+    def clear(self):
+        # where the next sample goes, and how many samples there are
+        self._next = 0
+        self.size = 0
+        self.next_sample = self._context.clock.time if self.interval else math.inf
+
+    def column(self, name, index):
+        """
+        Args:
+            name: the name of the column
+            index: the sample, from 0 for the oldest
+
+        Returns:
+            the value
+        """
+        return self._columns[name][(self._next - self.size + index) % self.capacity]
+
+    def record(self):
+        """
+        Take a sample of the device now.
+        """
+        context = self._context
+        now = context.clock.time
+        values = [now, STATE_NAMES.index(context._csm.state or "idle")]
+        for channel in context.channels:
+            values.extend((channel.value, channel.measurement, channel.filling))
+
+        position = self._next
+        block, offset = divmod(position, BLOCK)
+        for name, value in zip(self.names, values):
+            self._columns[name][position] = value
+            minimums, maximums, sums = self._blocks[name]
+            if offset == 0:
+                minimums[block] = maximums[block] = sums[block] = value
+            else:
+                if value < minimums[block]:
+                    minimums[block] = value
+                elif value > maximums[block]:
+                    maximums[block] = value
+                sums[block] += value
+        self._next = (position + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+        # skipping any samples missed by a jump in time, e.g. by advance_time
+        self.next_sample += ((now - self.next_sample) // self.interval + 1) * self.interval
+
+    def _summary(self, name, start, end):
+        """
+        Returns:
+            the minimum, maximum and sum of a column from sample start up to sample end
+        """
+        column = self._columns[name]
+        minimums, maximums, sums = self._blocks[name]
+        # the block being written holds the newest samples and, once the buffer is full, the oldest
+        current = self._next // BLOCK
+        parts = []
+
+        def add_samples(first, last):
+            if first < last:
+                values = column[first:last]
+                parts.append((min(values), max(values), sum(values)))
+
+        def add_blocks(first, last):
+            if first < last:
+                parts.append(
+                    (min(minimums[first:last]), max(maximums[first:last]), sum(sums[first:last]))
+                )
+
+        first = (self._next - self.size + start) % self.capacity
+        last = first + end - start
+        segments = (
+            [(first, last)]
+            if last <= self.capacity
+            else [(first, self.capacity), (0, last - self.capacity)]
+        )
+        for first, last in segments:
+            first_block = -(-first // BLOCK)
+            last_block = last // BLOCK
+            if first_block >= last_block:
+                add_samples(first, last)
+                continue
+            add_samples(first, first_block * BLOCK)
+            if first_block <= current < last_block:
+                add_blocks(first_block, current)
+                add_samples(current * BLOCK, (current + 1) * BLOCK)
+                add_blocks(current + 1, last_block)
+            else:
+                add_blocks(first_block, last_block)
+            add_samples(last_block * BLOCK, last)
+
+        return (
+            min(part[0] for part in parts),
+            max(part[1] for part in parts),
+            sum(part[2] for part in parts),
+        )
+
+    def windows(self, start=None, end=None, count=100):
+        """
+        Downsample the history into windows of equal time, with the minimum, maximum and mean of
+        each column over the samples in each.
+
+        Args:
+            start: simulated time to start from, the oldest sample if None
+            end: simulated time to end at, the newest sample if None
+            count: the number of windows
+
+        Returns:
+            list of dictionaries, one for each window with samples in it, of its start and end
+            time, its number of samples, the state of its last sample and the minimum, maximum and
+            mean of each column
+        """
+        if not self.size:
+            return []
+        times = _Times(self)
+        start = times[0] if start is None else float(start)
+        end = times[len(times) - 1] if end is None else float(end)
+        width = (end - start) / count if end > start else 1.0
+
+        windows = []
+        first = bisect.bisect_left(times, start)
+        for number in range(count):
+            window_end = start + (number + 1) * width
+            last = bisect.bisect_right(times, window_end if number < count - 1 else end, first)
+            if last > first:
+                window = {
+                    "start": start + number * width,
+                    "end": window_end,
+                    "samples": last - first,
+                    "state": STATE_NAMES[int(self.column("state", last - 1))],
+                    "min": {},
+                    "max": {},
+                    "mean": {},
+                }
+                for name in self.names[1:]:
+                    minimum, maximum, total = self._summary(name, first, last)
+                    window["min"][name] = minimum
+                    window["max"][name] = maximum
+                    window["mean"][name] = total / (last - first)
+                windows.append(window)
+            first = last
+        return windows
@@ -0,0 +1,47 @@
+import queue
+import threading
+import time
+
+from lewis.core.logging import has_log
+
+
+@has_log
+class DelayedReplies(object):
+    """
+    Sends replies through lewis stream handlers once they are due, from a thread of its own, so
+    that the simulation, the backdoor and the other connections carry on while a reply waits.
+
+    Replies are sent in the order they are added, which is the order they are due in as the serial
+    line queues transactions behind each other.
+    """
+
+    def __init__(self):
+        self._replies = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def add(self, handler, reply, due):
+        """
+        Args:
+            handler: the lewis stream handler of the connection to reply on
+            reply: the reply, without its terminator
+            due: when to send it, by time.monotonic
+        """
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._send_replies, name="Lm500DelayedReplies", daemon=True
+                )
+                self._thread.start()
+        self._replies.put((handler, reply, due))
+
+    def _send_replies(self):
+        while True:
+            handler, reply, due = self._replies.get()
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            try:
+                handler.unsolicited_reply(reply)
+            except Exception as error:
+                self.log.error(f"Failed to send delayed reply {reply!r}: {error!r}")
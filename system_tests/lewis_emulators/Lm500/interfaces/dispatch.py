@@ -0,0 +1,181 @@
+import re
+import time
+
+from lewis.adapters.stream import Func
+
+from ..metrics import UNRECOGNISED, Metrics
+
+# Regex characters which end the literal keyword at the start of a command pattern
+QUANTIFIERS = "?*+{"
+
+# Separates the commands of a compound request, and the replies to them
+COMMAND_SEPARATOR = b";"
+
+
+def literal_keyword(pattern):
+    """
+    Get the literal keyword a command pattern starts with, e.g. b"FILL?" for r"FILL\\?\\ (\\d+)$".
+
+    Args:
+        pattern: regular expression of the command
+
+    Returns:
+        the keyword as bytes, or None if the pattern can match requests with other keywords
+
+    """
+    literal = []
+    position = 1 if pattern.startswith("^") else 0
+    while position < len(pattern):
+        char = pattern[position]
+        if char == "\\" and position + 1 < len(pattern) and not pattern[position + 1].isalnum():
+            literal.append(pattern[position + 1])
+            position += 2
+        elif char.isalnum() or char == "_":
+            literal.append(char)
+            position += 1
+        else:
+            break
+
+    remainder = pattern[position:]
+    if remainder and remainder[0] in QUANTIFIERS:
+        # The last literal character is optional so can't be part of the keyword
+        return None
+
+    literal = "".join(literal)
+    if " " in literal:
+        keyword = literal.split(" ", 1)[0]
+    elif remainder == "$":
+        keyword = literal
+    else:
+        return None
+
+    return keyword.encode() if keyword else None
+
+
+class CommandDispatcher(object):
+    """
+    Indexes bound commands by the literal keyword at the start of their pattern, so that a request
+    is only matched against the one or two commands sharing its keyword instead of all of them.
+
+    Replies of the commands calling one of the cached functions are kept, by request, in a replies
+    dictionary which whoever changes what they depend on must clear. Every command is counted and
+    timed in metrics.
+    """
+
+    def __init__(self, bound_commands, replies=None, cached=(), metrics=None):
+        """
+        Args:
+            bound_commands: the interface's bound commands
+            replies: dictionary to cache replies in
+            cached: names of the functions whose replies can be cached
+            metrics: Metrics to record the commands in
+        """
+        self.commands = list(bound_commands)
+        self.replies = {} if replies is None else replies
+        self.metrics = Metrics() if metrics is None else metrics
+        self.cached = {cmd for cmd in self.commands if cmd.func.__name__ in cached}
+        self.index = {}
+        self.unindexed = []
+        for cmd in self.commands:
+            keyword = None
+            if not cmd.matcher.compiled_pattern.flags & re.IGNORECASE:
+                keyword = literal_keyword(cmd.matcher.pattern)
+            if keyword is None:
+                self.unindexed.append(cmd)
+            else:
+                self.index.setdefault(keyword, []).append(cmd)
+
+        for keyword in self.index:
+            self.index[keyword].extend(self.unindexed)
+
+    def candidates(self, request):
+        """
+        Args:
+            request: requested bytes
+
+        Returns:
+            the commands which could match the request
+
+        """
+        return self.index.get(request.split(b" ", 1)[0], self.unindexed)
+
+    def dispatch(self, request):
+        """
+        Process the request, which may be several commands separated by semicolons. The replies
+        of a compound request are joined by semicolons, commands without a reply are skipped.
+
+        Args:
+            request: requested bytes
+
+        Returns:
+            the mapped reply
+
+        """
+        if COMMAND_SEPARATOR not in request:
+            return self.dispatch_command(request)
+
+        replies = [
+            reply
+            for reply in (
+                self.dispatch_command(command.strip())
+                for command in request.split(COMMAND_SEPARATOR)
+            )
+            if reply is not None
+        ]
+        return COMMAND_SEPARATOR.decode().join(replies) if replies else None
+
+    def dispatch_command(self, request):
+        """
+        Process a single command with the first matching bound command, unless its reply is
+        cached, and record it in the metrics.
+
+        Args:
+            request: requested bytes
+
+        Returns:
+            the mapped reply of the command
+
+        """
+        if not self.metrics.enabled:
+            return self._dispatch_command(request)
+
+        start = time.perf_counter()
+        keyword = request.split(b" ", 1)[0]
+        if keyword not in self.index:
+            keyword = UNRECOGNISED
+        try:
+            reply = self._dispatch_command(request)
+        except Exception:
+            self.metrics.record_command(keyword, time.perf_counter() - start, True)
+            raise
+        self.metrics.record_command(keyword, time.perf_counter() - start)
+        return reply
+
+    def _dispatch_command(self, request):
+        reply = self.replies.get(request)
+        if reply is not None:
+            return reply
+
+        for cmd in self.candidates(request):
+            match = cmd.matcher.match(request)
+            if match is not None:
+                reply = cmd.map_return_value(cmd.func(*cmd.map_arguments(match)))
+                if cmd in self.cached:
+                    self.replies[request] = reply
+                return reply
+        raise RuntimeError("None of the device's commands matched.")
+
+    def as_func(self, dispatch=None):
+        """
+        Args:
+            dispatch: function taking each request in place of dispatch, e.g. to wrap it
+
+        Returns:
+            a command accepting every request, to be placed first in the interface's bound commands
+
+        """
+        return Func(
+            dispatch or self.dispatch,
+            r"(?s)^(.*)$",
+            doc="Dispatches the request to the command indexed by its keyword.",
+        )
@@ -1,12 +1,37 @@
+import os
+import time
+
 from lewis.adapters.stream import StreamInterface
 from lewis.core.logging import has_log
 from lewis.utils.command_builder import CmdBuilder
 
+from .delayed_replies import DelayedReplies
+from .dispatch import CommandDispatcher
+from .transcript import TranscriptRecorder
+
+# Queries whose replies only change when the device's settings do, so are cached by the device
+CACHED_QUERIES = (
+    "get_alarm",
+    "get_high",
+    "get_low",
+    "get_length",
+    "get_units",
+    "get_mode",
+    "get_type",
+    "get_interval",
+)
+
+# Set to a file name to record a transcript of the requests to the emulator from when it starts
+TRANSCRIPT_VARIABLE = "LM500_TRANSCRIPT"
+
 
 @has_log
 class Lm500StreamInterface(StreamInterface):
     in_terminator = "\r\n"
     out_terminator = "\r\n"
+    # The lewis stream adapter deletes the handler when a client disconnects, and fails when a
+    # second client disconnects unless it can still look it up
+    handler = None
 
     def __init__(self):
         super(Lm500StreamInterface, self).__init__()
@@ -53,6 +78,100 @@ class Lm500StreamInterface(StreamInterface):
             CmdBuilder("set_mode").escape("MODE ").char().eos().build(),
             CmdBuilder("set_units").escape("UNITS ").string().eos().build(),
         }
+        self.recorder = None
+        self.delayed_replies = DelayedReplies()
+
+    def _bind_device(self):
+        """
+        Bind the commands as usual, then put a dispatcher indexed by command keyword in front of
+        them so that requests are not matched against every command in turn, the replies to
+        queries of the device's settings are cached and the commands are recorded in the device's
+        metrics.
+        """
+        super(Lm500StreamInterface, self)._bind_device()
+        self.dispatcher = CommandDispatcher(
+            self.bound_commands, self.device.replies, CACHED_QUERIES, self.device.metrics
+        )
+        self.bound_commands.insert(0, self.dispatcher.as_func(self.handle_serial_request))
+        if self.recorder is None and os.environ.get(TRANSCRIPT_VARIABLE):
+            self.start_recording(os.environ[TRANSCRIPT_VARIABLE])
+
+    def handle_request(self, request):
+        """
+        Dispatch a request, recording it and its reply if a transcript is being recorded.
+
+        Args:
+            request: requested bytes
+
+        Returns:
+            the reply
+        """
+        if self.recorder is None:
+            return self.dispatcher.dispatch(request)
+
+        time, state = self.device.clock.time, self.device.state
+        try:
+            reply = self.dispatcher.dispatch(request)
+        except Exception as error:
+            self.recorder.record(time, state, request, error=error)
+            raise
+        self.recorder.record(time, state, request, reply)
+        return reply
+
+    def handle_serial_request(self, request):
+        """
+        Dispatch a request, and send the reply once the device's serial line would have carried
+        the request and the reply. lewis sends the reply as soon as this returns, holding the
+        device lock on its adapter loop until then, so a reply which has to wait is sent later by
+        delayed_replies instead, through the handler of the interface's latest connection, and
+        nothing is returned. A serial device has the one connection, e.g. the IOC's.
+
+        Args:
+            request: requested bytes
+
+        Returns:
+            the reply, or None if it will be sent later
+        """
+        reply = None
+        try:
+            reply = self.handle_request(request)
+        finally:
+            # a request which fails still occupies the line, but its error is handled at once
+            delay = self.serial_delay(request, reply)
+        if not delay or reply is None or self.handler is None:
+            return reply
+        self.delayed_replies.add(self.handler, str(reply), time.monotonic() + delay)
+        return None
+
+    def serial_delay(self, request, reply):
+        """
+        Args:
+            request: requested bytes, received now
+            reply: the reply, or None if there is none
+
+        Returns:
+            seconds until the reply would have been sent over the device's serial line
+        """
+        reply_length = 0 if reply is None else len(str(reply)) + len(self.out_terminator)
+        return self.device.serial_line.delay(
+            time.monotonic(), len(request) + len(self.in_terminator), reply_length
+        )
+
+    def start_recording(self, path):
+        """
+        Record the requests from now on, with their replies, to a transcript file.
+
+        Args:
+            path: the transcript file
+        """
+        self.stop_recording()
+        self.recorder = TranscriptRecorder(path)
+        self.log.info("Recording transcript to %s", path)
+
+    def stop_recording(self):
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
 
     def handle_error(self, request, error):
         """
@@ -63,6 +182,7 @@ class Lm500StreamInterface(StreamInterface):
             error: problem
 
         """
+        self.device.metrics.handled_errors += 1
         self.log.error("An error occurred at request " + repr(request) + ": " + repr(error))
 
     def get_alarm(self):
@@ -77,7 +197,7 @@ class Lm500StreamInterface(StreamInterface):
     def get_type(self, channel=None):
         if channel is None:
             channel = self.device.channel
-        return self.device.type[channel]
+        return self.device.channel_data(channel).type
 
     def get_channel(self):
         return self.device.channel
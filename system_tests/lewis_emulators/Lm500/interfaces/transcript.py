@@ -0,0 +1,87 @@
+import json
+
+# Simulated time is stepped by at most this much between the requests of a replayed transcript
+REPLAY_CYCLE = 0.1
+
+
+class TranscriptRecorder(object):
+    """
+    Writes the requests made to the device, with the replies to them, to a transcript file of one
+    JSON object per line, e.g.
+
+        {"t": 12.3, "state": "chan1", "request": "FILL? 1", "reply": "0 min"}
+
+    where t is the simulated time in seconds. Requests which raised an error have an "error"
+    instead of a "reply", and requests without a reply have a reply of null.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path: the transcript file, overwritten if it exists
+        """
+        self.path = path
+        # line buffered, so the transcript is complete up to the last request if the emulator dies
+        self._file = open(path, "w", buffering=1)
+
+    def record(self, time, state, request, reply=None, error=None):
+        """
+        Args:
+            time: simulated time of the request, in seconds
+            state: name of the device state
+            request: requested bytes
+            reply: the reply, or None if there was none
+            error: the error the request raised, if any
+        """
+        entry = {"t": round(time, 6), "state": state, "request": request.decode(errors="replace")}
+        if error is None:
+            entry["reply"] = reply
+        else:
+            entry["error"] = repr(error)
+        self._file.write(json.dumps(entry, separators=(",", ":")) + "\n")
+
+    def close(self):
+        self._file.close()
+
+
+def read_transcript(path):
+    """
+    Args:
+        path: the transcript file
+
+    Returns:
+        list of the transcript's entries, as dictionaries
+    """
+    with open(path) as transcript:
+        return [json.loads(line) for line in transcript if line.strip()]
+
+
+def replay(entries, interface, cycle=REPLAY_CYCLE):
+    """
+    Feed the requests of a transcript to an interface as fast as possible, stepping the simulation
+    of its device through the time between them, and compare the replies with the recorded ones.
+    The device should be in the state it was in when the recording started, e.g. newly created.
+
+    Args:
+        entries: the transcript's entries
+        interface: a Lm500StreamInterface bound to the device
+        cycle: longest simulated time step, in seconds
+
+    Returns:
+        list of (entry, actual reply or error) for the requests whose reply did not match
+    """
+    device = interface.device
+    mismatches = []
+    for entry in entries:
+        while device.clock.time < entry["t"]:
+            device.process(min(cycle, entry["t"] - device.clock.time))
+
+        try:
+            actual = {"reply": interface.handle_request(entry["request"].encode())}
+        except Exception as error:
+            actual = {"error": repr(error)}
+
+        expected = {key: entry[key] for key in ("reply", "error") if key in entry}
+        if actual != expected:
+            mismatches.append((entry, actual))
+    return mismatches
@@ -0,0 +1,221 @@
+import math
+import random
+
+from lewis.core.logging import has_log
+
+from .channel import READ_IN_PROGRESS
+
+DISABLED = "Disabled"
+SAMPLE_HOLD = "Sample/Hold"
+CONTINUOUS = "Continuous"
+
+# Sensor types of the channels
+HELIUM = 0
+NITROGEN = 1
+
+
+def interval_seconds(interval):
+    """
+    Args:
+        interval: a sample interval as "HH:MM:SS"
+
+    Returns:
+        the interval in seconds
+    """
+    hours, minutes, seconds = (int(part) for part in interval.split(":"))
+    return hours * 3600 + minutes * 60 + seconds
+
+
+class MeasurementModel(object):
+    """
+    How long measuring a channel takes and how far its reading is from its level. A helium sensor
+    is read by heating it along its length, so takes longer the longer it is, and the heat boils
+    off helium, lowering the level by boil_off_rate for each second of the measurement. A nitrogen
+    sensor is read capacitively, by default with no time for its length. Each reading is off by
+    Gaussian noise with a standard deviation of noise, to one decimal place.
+    """
+
+    def __init__(
+        self,
+        helium_seconds_per_length=0.0,
+        nitrogen_seconds_per_length=0.0,
+        noise=0.0,
+        boil_off_rate=0.0,
+        seed=None,
+    ):
+        """
+        Args:
+            helium_seconds_per_length: time to measure a helium sensor, per unit of its length
+            nitrogen_seconds_per_length: time to measure a nitrogen sensor, per unit of its length
+            noise: standard deviation of the readings from the level
+            boil_off_rate: fall of the level of a helium channel per second of its measurement
+            seed: seed of the noise, for readings which are the same each run, or None
+        """
+        self.configure(
+            helium_seconds_per_length, nitrogen_seconds_per_length, noise, boil_off_rate, seed
+        )
+
+    def configure(
+        self,
+        helium_seconds_per_length=0.0,
+        nitrogen_seconds_per_length=0.0,
+        noise=0.0,
+        boil_off_rate=0.0,
+        seed=None,
+    ):
+        if min(helium_seconds_per_length, nitrogen_seconds_per_length, noise, boil_off_rate) < 0:
+            raise ValueError("Measurement times, noise and boil-off rate cannot be negative")
+        self.helium_seconds_per_length = helium_seconds_per_length
+        self.nitrogen_seconds_per_length = nitrogen_seconds_per_length
+        self.noise = noise
+        self.boil_off_rate = boil_off_rate
+        self.seed = seed
+        self._random = random.Random(seed)
+
+    def duration(self, channel, fixed, sensor_length):
+        """
+        Args:
+            channel: the data of the channel
+            fixed: time any measurement takes, in seconds
+            sensor_length: the length of the sensor
+
+        Returns:
+            seconds measuring the channel takes
+        """
+        if channel.type == HELIUM:
+            seconds_per_length = self.helium_seconds_per_length
+        else:
+            seconds_per_length = self.nitrogen_seconds_per_length
+        return fixed + seconds_per_length * float(sensor_length)
+
+    def boil_off(self, channel, seconds):
+        """
+        Lower the level of a helium channel by what a measurement of it boils off.
+
+        Args:
+            channel: the data of the channel
+            seconds: the time the measurement takes
+        """
+        if channel.type == HELIUM and self.boil_off_rate and seconds:
+            channel.value = max(0.0, channel.value - self.boil_off_rate * seconds)
+
+    def reading(self, value):
+        """
+        Args:
+            value: the level of the channel
+
+        Returns:
+            the level as measured
+        """
+        if not self.noise:
+            return value
+        return max(0.0, round(value + self._random.gauss(0.0, self.noise), 1))
+
+
+@has_log
+class MeasurementScheduler(object):
+    """
+    Takes the measurements of the device's channels: those it is asked for and those it takes on
+    its own, of every channel each sample interval in Sample/Hold mode or one after another in
+    Continuous mode. A measurement takes the time the device's measurement model gives for the
+    channel, of simulated time, while the channel's read is in progress, and is of the level at
+    the end of it.
+
+    Rather than working out what is due every cycle, the time anything is next due is kept in
+    due, for the device to compare with its clock.
+    """
+
+    def __init__(self, context):
+        """
+        Args:
+            context: the device
+        """
+        self._context = context
+        self._set_logging_context(context)
+        self.mode = DISABLED
+        self.period = 0.0
+        # when the device next measures on its own, or infinity if it will not
+        self.next_sample = math.inf
+        self.due = math.inf
+
+    def schedule(self, mode, period):
+        """
+        Schedule the measurements the device takes on its own from now on.
+
+        Args:
+            mode: the sample mode
+            period: the sample interval in seconds
+        """
+        self.mode = mode
+        self.period = period
+        now = self._context.clock.time
+        if mode == CONTINUOUS:
+            self.next_sample = now
+        elif mode == SAMPLE_HOLD and period > 0:
+            self.next_sample = now + period
+        else:
+            self.next_sample = math.inf
+        self.update_due()
+
+    def update_due(self):
+        reads = [
+            channel.read_until
+            for channel in self._context.channels
+            if channel.read_until is not None
+        ]
+        self.due = min(reads + [self.next_sample])
+
+    def start(self, channel):
+        """
+        Start measuring a channel, unless it is being measured already.
+
+        Args:
+            channel: the data of the channel to measure
+        """
+        if channel.read_until is not None:
+            return
+        context = self._context
+        duration = context.measurement_time(channel)
+        context.measurement_model.boil_off(channel, duration)
+        if duration > 0:
+            channel.read_until = context.clock.time + duration
+            context.set_status_bit(channel, READ_IN_PROGRESS, True)
+            self.update_due()
+        else:
+            self.finish(channel)
+
+    def finish(self, channel):
+        """
+        Take the measurement of a channel, of its level now.
+
+        Args:
+            channel: the data of the channel
+        """
+        channel.read_until = None
+        channel.measurement = self._context.measurement_model.reading(channel.value)
+        channel.measured = True
+        self._context.set_status_bit(channel, READ_IN_PROGRESS, False)
+        self._context.update_alarm(channel)
+
+    def step(self):
+        """
+        Finish the measurements which have taken their time, then start any the device takes on
+        its own which are due.
+        """
+        context = self._context
+        now = context.clock.time
+        for channel in context.channels:
+            if channel.read_until is not None and now >= channel.read_until:
+                self.finish(channel)
+
+        if now >= self.next_sample:
+            for channel in context.channels:
+                self.start(channel)
+            if self.mode == CONTINUOUS:
+                self.next_sample = now + max(
+                    context.measurement_time(channel) for channel in context.channels
+                )
+            else:
+                # skipping any samples missed by a jump in time, e.g. by advance_time
+                self.next_sample += ((now - self.next_sample) // self.period + 1) * self.period
+        self.update_due()
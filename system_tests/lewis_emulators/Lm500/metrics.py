@@ -0,0 +1,84 @@
+import bisect
+
+# Upper bounds of the latency histogram buckets in seconds, with a last bucket for anything longer
+LATENCY_BOUNDS = (1e-5, 3e-5, 1e-4, 3e-4, 1e-3, 3e-3, 1e-2, 3e-2, 1e-1)
+LATENCY_LABELS = tuple(f"<={bound * 1000:g} ms" for bound in LATENCY_BOUNDS) + (
+    f">{LATENCY_BOUNDS[-1] * 1000:g} ms",
+)
+
+# Commands with a keyword none of the device's commands have are counted together under this
+UNRECOGNISED = b"unrecognised"
+
+
+class LatencyHistogram(object):
+    """
+    Counts of something timed, e.g. a command, with a histogram of how long it took.
+    """
+
+    __slots__ = ("count", "errors", "total", "max", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * len(LATENCY_LABELS)
+
+    def add(self, seconds, error=False):
+        """
+        Args:
+            seconds: how long it took
+            error: whether it failed
+        """
+        self.count += 1
+        if error:
+            self.errors += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.buckets[bisect.bisect_left(LATENCY_BOUNDS, seconds)] += 1
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "mean_ms": self.total / self.count * 1000 if self.count else 0.0,
+            "max_ms": self.max * 1000,
+            "histogram": dict(zip(LATENCY_LABELS, self.buckets)),
+        }
+
+
+class Metrics(object):
+    """
+    Counts and latencies of the commands processed by the device, by command keyword, and of its
+    simulation cycles.
+    """
+
+    def __init__(self):
+        # timing costs about a microsecond a command or cycle, so can be turned off
+        self.enabled = True
+        self.reset()
+
+    def reset(self):
+        self.commands = {}
+        self.cycles = LatencyHistogram()
+        # requests which got no reply because of an error
+        self.handled_errors = 0
+
+    def record_command(self, keyword, seconds, error=False):
+        """
+        Args:
+            keyword: the command's keyword as bytes, e.g. b"MEAS?", or UNRECOGNISED
+            seconds: how long the command took to process
+            error: whether the command failed
+        """
+        histogram = self.commands.get(keyword)
+        if histogram is None:
+            histogram = self.commands[keyword] = LatencyHistogram()
+        histogram.add(seconds, error)
+
+    def command_dicts(self):
+        return {
+            keyword.decode(errors="replace"): histogram.as_dict()
+            for keyword, histogram in self.commands.items()
+        }
@@ -0,0 +1,72 @@
+import random
+
+PARITIES = "NOEMS"
+
+
+class SerialLine(object):
+    """
+    Timing model of the RS-232 line to the device, shared by everything talking to it. Each
+    transaction takes the time to send the request and the reply character by character, plus
+    the device's processing delay and a random jitter, and waits for any transaction before it to
+    finish. With a baud rate of 0 the line takes no time at all.
+    """
+
+    def __init__(self, baud_rate=0, framing="8N1", processing_delay=0.0, jitter=0.0):
+        """
+        Args:
+            baud_rate: bits per second, or 0 to reply instantly
+            framing: data bits, parity (N, O, E, M or S) and stop bits, e.g. "8N1" or "7E1"
+            processing_delay: time the device takes to process a command, in seconds
+            jitter: the most random extra time a transaction can take, in seconds
+        """
+        self.configure(baud_rate, framing, processing_delay, jitter)
+        # when the line is free of the transactions so far, by the clock passed to delay
+        self.busy_until = 0.0
+
+    def configure(self, baud_rate, framing="8N1", processing_delay=0.0, jitter=0.0):
+        data_bits, parity, stop_bits = int(framing[0]), framing[1].upper(), float(framing[2:])
+        if parity not in PARITIES or not 5 <= data_bits <= 8 or stop_bits not in (1, 1.5, 2):
+            raise ValueError(f"Invalid framing: {framing}")
+        if baud_rate < 0 or processing_delay < 0 or jitter < 0:
+            raise ValueError("Baud rate and delays cannot be negative")
+
+        self.baud_rate = baud_rate
+        self.framing = framing
+        self.processing_delay = processing_delay
+        self.jitter = jitter
+        # a start bit, the data bits, a parity bit unless there is no parity and the stop bits
+        bits = 1 + data_bits + (parity != "N") + stop_bits
+        self.character_time = bits / baud_rate if baud_rate else 0.0
+
+    def transaction_time(self, request_length, reply_length):
+        """
+        Args:
+            request_length: characters in the request, with its terminator
+            reply_length: characters in the reply, with its terminator, or 0 if there is none
+
+        Returns:
+            seconds the transaction occupies the line for
+        """
+        time = (request_length + reply_length) * self.character_time + self.processing_delay
+        if self.jitter:
+            time += random.uniform(0, self.jitter)
+        return time
+
+    def delay(self, now, request_length, reply_length):
+        """
+        Occupy the line with a transaction starting now, or as soon as the line is free.
+
+        Args:
+            now: the current time, in seconds
+            request_length: characters in the request, with its terminator
+            reply_length: characters in the reply, with its terminator, or 0 if there is none
+
+        Returns:
+            seconds from now until the reply has been sent
+        """
+        if not self.baud_rate:
+            return 0.0
+        self.busy_until = max(now, self.busy_until) + self.transaction_time(
+            request_length, reply_length
+        )
+        return self.busy_until - now
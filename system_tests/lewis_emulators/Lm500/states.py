@@ -1,128 +1,126 @@
-from datetime import datetime
-
 from lewis.core import approaches
+from lewis.core.logging import has_log
 from lewis.core.statemachine import State
 
+from .channel import REFILL_ACTIVE, REFILL_TIMEOUT
 
-class resetState(State):
-    def reset_fill(self, channel):
-        self._context.fill_start[channel] = 0
-        self._context.filling[channel] = False
-        self._context.fill_time[channel] = 0
-        if self._context.fill_status_val[channel] != "Timeout":
-            self._context.fill_status_val[channel] = "Off"
-
-
-class IdleState(resetState):
-    def on_entry(self, dt):
-        self.reset_fill(1)
-        self.reset_fill(2)
-
-
-class FillingChan1State(resetState):
-    def on_entry(self, dt):
-        self._context.fill_start[1] = datetime.now()
-        self.reset_fill(2)
-        self._context.log.info(f"Start 1 {self._context.fill_start[1]}")
-        self._context.log.info(f"Start 2 {self._context.fill_start[2]}")
-
-    def in_state(self, dt):
-        old_position = self._context.value[1]
-        self._context.value[1] = approaches.linear(
-            old_position, self._context.high_threshold, self._context.fill_speed, dt
-        )
-        self.log.info(
-            "Filled from (%s -> %s), target=%s, speed=%s, dt=%s",
-            old_position,
-            self._context.value[1],
-            self._context.high_threshold,
-            self._context.fill_speed,
-            dt,
-        )
-        self._context.fill_time[1] = round(
-            (datetime.now() - self._context.fill_start[1]).total_seconds() / 60
-        )
-
-    def on_exit(self, dt):
-        if self._context.fill_time[1] > self._context.max_fill_time:
-            self._context.fill_status_val[1] = "Timeout"
-
+CHANNEL_IDLE = "idle"
+CHANNEL_FILLING = "filling"
 
-class FillingChan2State(resetState):
-    def on_entry(self, dt):
-        self._context.fill_start[2] = datetime.now()
-        self.reset_fill(1)
-        self._context.log.info(f"Start 1 {self._context.fill_start[1]}")
-        self._context.log.info(f"Start 2 {self._context.fill_start[2]}")
 
+class FillingState(State):
     def in_state(self, dt):
-        old_position = self._context.value[2]
-        self._context.value[2] = approaches.linear(
-            old_position, self._context.high_threshold, self._context.fill_speed, dt
-        )
+        for channel_fill in self._context.channel_fills:
+            channel_fill.step(dt)
+
+
+@has_log
+class ChannelFill(object):
+    """
+    The fill state machine of a single channel. It is idle until a fill of the channel is
+    requested, then fills until the level reaches the high threshold or the fill times out.
+    """
+
+    def __init__(self, context, channel):
+        """
+        Args:
+            context: the device
+            channel: the data of the channel to fill
+        """
+        self._context = context
+        self._set_logging_context(context)
+        self.channel = channel
+        self.state = CHANNEL_IDLE
+        self._last_logged = None
+
+    def step(self, dt):
+        """
+        Take any transition due, then fill the channel for dt seconds if it is filling.
+
+        Args:
+            dt: simulated time since the last step
+        """
+        context = self._context
+        channel = self.channel
+        if context._check_transitions:
+            if self.state == CHANNEL_IDLE:
+                if channel.filling:
+                    if channel.value < context.high_threshold:
+                        self.start_fill()
+                    else:
+                        self.reset_fill()
+            elif (
+                channel.value >= context.high_threshold or channel.fill_time > context.max_fill_time
+            ):
+                self.stop_fill()
+
+        if self.state == CHANNEL_FILLING:
+            self.fill(dt)
+
+    def start_fill(self):
+        self.state = CHANNEL_FILLING
+        self.channel.fill_start = self._context.clock.time
+        self._context.set_status_bit(self.channel, REFILL_ACTIVE, True)
+        self._context.set_status_bit(self.channel, REFILL_TIMEOUT, False)
+        self._context.mark_dirty()
+        self._context.invalidate_replies()
+        self._last_logged = None
         self.log.info(
-            "Filled from (%s -> %s), target=%s, speed=%s, dt=%s",
-            old_position,
-            self._context.value[2],
-            self._context.high_threshold,
-            self._context.fill_speed,
-            dt,
-        )
-
-        self._context.fill_time[2] = round(
-            (datetime.now() - self._context.fill_start[2]).total_seconds() / 60
+            "Channel %d fill started at %s s", self.channel.number, self._context.clock.time
         )
 
-    def on_exit(self, dt):
-        if self._context.fill_time[2] > self._context.max_fill_time:
-            self._context.fill_status_val[2] = "Timeout"
-
-
-class FillingBothState(State):
-    def on_entry(self, dt):
-        self._context.log.info(f"Start 1 {self._context.fill_start[1]}")
-        self._context.log.info(f"Start 2 {self._context.fill_start[2]}")
-        if self._context.fill_start[1] == 0:
-            self._context.fill_start[1] = datetime.now()
-        else:
-            self._context.fill_start[2] = datetime.now()
-        self._context.log.info(f"Start 1 {self._context.fill_start[1]}")
-        self._context.log.info(f"Start 2 {self._context.fill_start[2]}")
-
-    def in_state(self, dt):
-        old_position = self._context.value[1]
-        self._context.value[1] = approaches.linear(
-            old_position, self._context.high_threshold, self._context.fill_speed, dt
+    def stop_fill(self):
+        if self.channel.fill_time > self._context.max_fill_time:
+            self.channel.fill_status = "Timeout"
+        self.reset_fill()
+
+    def reset_fill(self):
+        channel = self.channel
+        self.state = CHANNEL_IDLE
+        channel.fill_start = None
+        channel.filling = False
+        channel.fill_time = 0
+        if channel.fill_status != "Timeout":
+            channel.fill_status = "Off"
+        self._context.set_status_bit(channel, REFILL_ACTIVE, False)
+        self._context.set_status_bit(channel, REFILL_TIMEOUT, channel.fill_status == "Timeout")
+        self._context.mark_dirty()
+        self._context.invalidate_replies()
+
+    def fill(self, dt):
+        context = self._context
+        channel = self.channel
+        # the level is a float, even when it reaches a high threshold set as an int
+        channel.value = float(
+            approaches.linear(channel.value, context.high_threshold, context.fill_speed, dt)
         )
+        channel.fill_time = round((context.clock.time - channel.fill_start) / 60)
+        context.mark_dirty()
+        self.log_fill_progress()
+
+    def log_fill_progress(self):
+        """
+        Log the fill progress of the channel when its fill time changes or fill_log_interval
+        seconds have passed since it was last logged, rather than every cycle.
+        """
+        context = self._context
+        if not context.fill_logging:
+            return
+
+        fill_time = self.channel.fill_time
+        if (
+            self._last_logged is not None
+            and context.clock.time - self._last_logged[0] < context.fill_log_interval
+            and fill_time == self._last_logged[1]
+        ):
+            return
+
+        self._last_logged = (context.clock.time, fill_time)
         self.log.info(
-            "Filled from (%s -> %s), target=%s, speed=%s",
-            old_position,
-            self._context.value[1],
-            self._context.high_threshold,
-            self._context.fill_speed,
+            "Channel %d filled to %s, target=%s, speed=%s, fill_time=%s min",
+            self.channel.number,
+            self.channel.value,
+            context.high_threshold,
+            context.fill_speed,
+            fill_time,
         )
-        old_position = self._context.value[2]
-        self._context.value[2] = approaches.linear(
-            old_position, self._context.high_threshold, self._context.fill_speed, dt
-        )
-        self.log.info(
-            "Filled from (%s -> %s), target=%s, speed=%s",
-            old_position,
-            self._context.value[2],
-            self._context.high_threshold,
-            self._context.fill_speed,
-        )
-        self._context.fill_time[1] = round(
-            (datetime.now() - self._context.fill_start[1]).total_seconds() / 60
-        )
-        self._context.fill_time[2] = round(
-            (datetime.now() - self._context.fill_start[2]).total_seconds() / 60
-        )
-
-    def on_exit(self, dt):
-        if self._context.value[1] == self._context.high_threshold:
-            if self._context.fill_time[1] > self._context.max_fill_time:
-                self._context.fill_status_val[1] = "Timeout"
-        if self._context.value[2] == self._context.high_threshold:
-            if self._context.fill_time[2] > self._context.max_fill_time:
-                self._context.fill_status_val[2] = "Timeout"
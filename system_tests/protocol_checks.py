@@ -0,0 +1,86 @@
+"""
+Checks of the IOC's protocols against the Lm500 emulator, without an IOC or channel access, by
+interpreting lm500Sup/lm500.proto for the records of lm500Sup/lm500.db in this process with
+stream_protocol.StreamIoc.
+"""
+
+from lewis_emulators.Lm500 import SimulatedLm500
+from lewis_emulators.Lm500.interfaces import Lm500StreamInterface
+from stream_config import DEFAULT_MACROS
+from stream_protocol import StreamError, StreamIoc
+
+PREFIX = DEFAULT_MACROS["P"]
+
+# (setpoint record, readback record, [(value put, value expected back)]), as in tests/lm500.py
+SETPOINT_CASES = [
+    ("BOOST:SP", "BOOST", [("Off", "Off"), ("On", "On"), ("Smart", "Smart")]),
+    (
+        "OUTPUT:SP",
+        "OUTPUT",
+        [(state, state) for state in ("Remote Select", "Channel 1", "Channel 2")],
+    ),
+    (
+        "ERROR:SP",
+        "ERROR",
+        [("Disable", "Reporting Disabled"), ("Enable", "Reporting Enabled")],
+    ),
+    ("HIGH:SP", "HIGH", [(0, 0), (0.65, 0.65), (6000, 6000)]),
+    ("LOW:SP", "LOW", [(0, 0), (0.65, 0.65), (6000, 6000)]),
+    ("INTRVL:SP", "INTRVL", [("00:00:00", "00:00:00"), ("10:20:30", "10:20:30")]),
+    ("MODE:SP:RAW", "MODE", [("0", "Disabled"), ("S", "Sample/Hold"), ("C", "Continuous")]),
+    ("CHANNEL:SP", "CHANNEL", [("Channel 1", "Channel 1"), ("Channel 2", "Channel 2")]),
+    ("UNITS:SP", "UNITS", [("CM", "CM"), ("IN", "IN"), ("%", "%")]),
+]
+
+
+def new_ioc():
+    device = SimulatedLm500()
+    interface = Lm500StreamInterface()
+    interface.device = device
+    return StreamIoc(interface)
+
+
+def process_all(ioc):
+    """
+    Process every stream record once, but those processed by the replies to others.
+
+    Returns:
+        dictionary of the errors by record name
+    """
+    errors = {}
+    for name in ioc.links:
+        if name in ioc.interrupt_records:
+            continue
+        try:
+            ioc.process(name)
+        except StreamError as error:
+            errors[name] = error
+    return errors
+
+
+def run_setpoint_cases(ioc, serial_timing):
+    """
+    Args:
+        ioc: the StreamIoc
+        serial_timing: arguments of SimulatedLm500.set_serial_timing for the device
+
+    Returns:
+        (number of cases, dictionary of the failures by case)
+    """
+    failures = {}
+    cases = 0
+    for setpoint, readback, values in SETPOINT_CASES:
+        for value, expected in values:
+            cases += 1
+            case = f"{setpoint}={value}"
+            ioc.interface.device.reset()
+            ioc.interface.device.set_serial_timing(*serial_timing)
+            try:
+                ioc.put(PREFIX + setpoint, value)
+                actual = ioc.process(PREFIX + readback)
+            except StreamError as error:
+                failures[case] = str(error)
+                continue
+            if actual != expected:
+                failures[case] = f"{readback} is {actual!r}, expected {expected!r}"
+    return cases, failures
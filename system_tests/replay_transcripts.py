@@ -0,0 +1,71 @@
+"""
+Replay transcripts recorded by the Lm500 emulator against a new emulated device.
+
+A transcript is recorded by starting the emulator with LM500_TRANSCRIPT set to the file to record
+to. Replaying one feeds its requests straight to Lm500StreamInterface, without an IOC, channel
+access or waiting in real time, and checks that the replies are the same as when it was recorded.
+
+Usage: python replay_transcripts.py [TRANSCRIPT_OR_DIRECTORY ...]
+"""
+
+import argparse
+import glob
+import os
+import sys
+import time
+
+from lewis_emulators.Lm500 import SimulatedLm500
+from lewis_emulators.Lm500.interfaces import Lm500StreamInterface
+from lewis_emulators.Lm500.interfaces.transcript import read_transcript, replay
+
+TRANSCRIPT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "transcripts")
+
+
+def transcript_files(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            yield from sorted(glob.glob(os.path.join(path, "*.jsonl")))
+        else:
+            yield path
+
+
+def replay_file(path):
+    """
+    Replay a transcript against a new emulated device.
+
+    Args:
+        path: the transcript file
+
+    Returns:
+        (number of requests, list of (entry, actual reply or error) of the mismatched requests)
+    """
+    interface = Lm500StreamInterface()
+    interface.device = SimulatedLm500()
+    entries = read_transcript(path)
+    return len(entries), replay(entries, interface)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "paths", nargs="*", default=[TRANSCRIPT_DIR], help="Transcripts, or directories of them"
+    )
+    args = parser.parse_args()
+
+    failed = False
+    for path in transcript_files(args.paths):
+        start = time.perf_counter()
+        requests, mismatches = replay_file(path)
+        seconds = time.perf_counter() - start
+
+        print(f"{path}: {requests} requests, {len(mismatches)} mismatched, in {seconds:.3f} s")
+        for entry, actual in mismatches:
+            expected = {key: entry[key] for key in ("reply", "error") if key in entry}
+            print(f"    {entry['request']!r} at {entry['t']} s: expected {expected}, got {actual}")
+        failed = failed or bool(mismatches)
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,11 @@
+@echo off
+REM Run this directory's tests in parallel using the IOC Testing Framework
+
+SET CurrentDir=%~dp0
+
+call "%~dp0..\..\..\..\config_env.bat"
+
+set "PYTHONUNBUFFERED=1"
+
+call %PYTHON3% "%~dp0run_parallel.py" --framework "%EPICS_KIT_ROOT%\support\IocTestFramework\master\run_tests.py" %*
+IF %ERRORLEVEL% NEQ 0 EXIT /b %errorlevel%
@@ -0,0 +1,168 @@
+"""
+Run this directory's tests in parallel using the IOC Testing Framework.
+
+The test cases of each test mode are split between worker processes. Each worker runs the
+framework on its share with its own emulator and its own IOC instance, LM500_01, LM500_02 and so
+on, so that the workers' PVs and emulator ports do not clash. There is a worker for each IOC
+instance whose iocBoot directory exists, iocLM500-IOC-01, iocLM500-IOC-02 and so on, unless fewer
+are asked for.
+
+Usage: python run_parallel.py [--workers N] [--test-modes RECSIM DEVSIM] [--logs DIR]
+    [--framework PATH/run_tests.py]
+"""
+
+import argparse
+import os
+import queue
+import subprocess
+import sys
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+TEST_MODULE = "lm500"
+TEST_CLASS = "Lm500Tests"
+
+
+def default_framework():
+    return os.path.join(
+        os.environ.get("EPICS_KIT_ROOT", ""),
+        "support",
+        "IocTestFramework",
+        "master",
+        "run_tests.py",
+    )
+
+
+def discover(framework):
+    """
+    Args:
+        framework: the framework's run_tests.py, whose directory has the utilities the tests use
+
+    Returns:
+        the test modes of the tests, and the names of the test cases, with parameterized tests
+        expanded
+    """
+    sys.path[:0] = [TEST_DIR, os.path.dirname(framework)]
+    from tests import lm500
+
+    test_class = getattr(lm500, TEST_CLASS)
+    names = unittest.TestLoader().getTestCaseNames(test_class)
+    return [mode.name for mode in lm500.TEST_MODES], names
+
+
+def ioc_directory(ioc_number):
+    # the framework's utilities are importable once discover has run
+    from utils.ioc_launcher import get_default_ioc_dir
+
+    return get_default_ioc_dir("LM500", iocnum=ioc_number)
+
+
+def count_iocs():
+    """
+    Returns:
+        the number of IOC instances, LM500_01, LM500_02 and so on, whose iocBoot directories exist
+    """
+    count = 0
+    while os.path.isdir(ioc_directory(count + 1)):
+        count += 1
+    return count
+
+
+def split(names, parts):
+    """
+    Deal names into parts as even as possible, keeping the cases of a parameterized test apart.
+    """
+    return [chunk for chunk in (names[part::parts] for part in range(parts)) if chunk]
+
+
+def run_job(framework, mode, names, slots, logs):
+    """
+    Run some of the tests in one test mode, in the first free worker slot.
+
+    Returns:
+        (test mode, number of tests, IOC number, return code, seconds taken, log file)
+    """
+    ioc_number = slots.get()
+    log_path = os.path.join(logs, f"{mode.lower()}_{ioc_number:02d}_{names[0]}.log")
+    start = time.monotonic()
+    try:
+        with open(log_path, "w") as log:
+            return_code = subprocess.call(
+                [
+                    sys.executable,
+                    framework,
+                    "--test_and_emulator",
+                    TEST_DIR,
+                    "-tm",
+                    mode,
+                    "-t",
+                ]
+                + [f"{TEST_MODULE}.{TEST_CLASS}.{name}" for name in names],
+                env=dict(os.environ, PYTHONUNBUFFERED="1", LM500_IOC_NUMBER=str(ioc_number)),
+                stdout=log,
+                stderr=subprocess.STDOUT,
+            )
+    finally:
+        slots.put(ioc_number)
+    return mode, len(names), ioc_number, return_code, time.monotonic() - start, log_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--workers", type=int, help="Worker processes, default one for each IOC instance"
+    )
+    parser.add_argument("--test-modes", nargs="+", help="Test modes to run, default all")
+    parser.add_argument(
+        "--logs", default=os.path.join(TEST_DIR, "parallel_logs"), help="Directory for logs"
+    )
+    parser.add_argument(
+        "--framework", default=default_framework(), help="The framework's run_tests.py"
+    )
+    args = parser.parse_args()
+
+    modes, names = discover(args.framework)
+    modes = args.test_modes or modes
+    if args.workers is not None and args.workers < 1:
+        parser.error("--workers must be at least 1")
+    iocs = count_iocs()
+    workers = args.workers or iocs
+    if workers < 1:
+        parser.error(f"No IOC instance to run the tests on, {ioc_directory(1)} does not exist")
+    if workers > iocs:
+        parser.error(
+            f"{workers} workers need IOC instances up to LM500_{workers:02d}, but "
+            f"{ioc_directory(iocs + 1)} does not exist"
+        )
+    os.makedirs(args.logs, exist_ok=True)
+
+    # a worker slot is an IOC instance, which only one job at a time may use
+    slots = queue.Queue()
+    for ioc_number in range(1, workers + 1):
+        slots.put(ioc_number)
+    jobs = [(mode, chunk) for mode in modes for chunk in split(names, workers)]
+
+    start = time.monotonic()
+    failed = False
+    with ThreadPoolExecutor(workers) as executor:
+        futures = [
+            executor.submit(run_job, args.framework, mode, chunk, slots, args.logs)
+            for mode, chunk in jobs
+        ]
+        for future in futures:
+            mode, count, ioc_number, return_code, seconds, log_path = future.result()
+            failed = failed or return_code != 0
+            result = "passed" if return_code == 0 else "FAILED"
+            print(
+                f"{mode:<8} {count:3d} tests on LM500_{ioc_number:02d} {result:<7}"
+                f" in {seconds:6.1f} s, see {log_path}"
+            )
+
+    print(f"{len(names)} tests in {len(modes)} mode(s) took {time.monotonic() - start:.1f} s")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
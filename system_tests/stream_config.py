@@ -0,0 +1,254 @@
+"""
+Reads the StreamDevice configuration of the IOC, lm500Sup/lm500.db and lm500Sup/lm500.proto, so
+that tools can work out what the IOC sends to the device.
+"""
+
+import os
+import re
+
+SUPPORT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "lm500Sup")
+DATABASE_FILE = os.path.join(SUPPORT_DIR, "lm500.db")
+PROTOCOL_FILE = os.path.join(SUPPORT_DIR, "lm500.proto")
+
+DEFAULT_MACROS = {"P": "LM500_01:", "PORT": "L0"}
+
+PROTOCOL_TOKEN = re.compile(
+    r"\s+|\#[^\n]*"
+    r"""|(?P<string>"(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')"""
+    r"|(?P<word>[@\w.$-]+)"
+    r"|(?P<symbol>[{};=])"
+)
+ESCAPES = {"r": "\r", "n": "\n", "t": "\t"}
+ARGUMENT = re.compile(r"\\\$(\d)|\\(.)", re.DOTALL)
+
+RECORD = re.compile(r'record\(\s*(\w+)\s*,\s*"([^"]*)"\s*\)\s*\{(.*?)\n\}', re.DOTALL)
+FIELD = re.compile(r'field\(\s*(\w+)\s*,\s*"([^"]*)"\s*\)')
+MACRO = re.compile(r"\$\((\w+)\)")
+STREAM_LINK = re.compile(r"^@(\S+)\s+(\w+)(?:\((.*)\))?\s+(\S+)")
+PERIODIC_SCAN = re.compile(r"^\s*(\d*\.?\d+)\s+seconds?\s*$")
+
+
+class Protocol(object):
+    """
+    A protocol of a StreamDevice protocol file.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        # commands such as ("out", ["MEAS?"]), strings still escaped as in the file
+        self.commands = []
+        self.variables = {}
+        # exception handlers such as "@init", each a Protocol
+        self.handlers = {}
+        # protocols defined inside this one, only used for the top level of the file
+        self.protocols = {}
+
+    def __repr__(self):
+        return f"Protocol({self.name!r})"
+
+
+class ProtocolFile(object):
+    """
+    The protocols of a StreamDevice protocol file, and the variables set outside them.
+    """
+
+    def __init__(self, protocols, variables):
+        self.protocols = protocols
+        self.variables = variables
+        self._protocols_by_name = {name.lower(): protocol for name, protocol in protocols.items()}
+
+    def protocol(self, name):
+        """
+        Args:
+            name: the protocol name, as a record's link gives it
+
+        Returns:
+            the protocol, which StreamDevice looks up regardless of case, e.g. setLOW for setLow
+
+        Raises:
+            KeyError: if the file has no protocol of that name
+        """
+        return self._protocols_by_name[name.lower()]
+
+    def variable(self, protocol, name, default=None):
+        """
+        Args:
+            protocol: the protocol
+            name: name of the variable, e.g. "ReplyTimeout"
+            default: value if it is not set in the protocol or the file
+
+        Returns:
+            the value of the variable as it applies to the protocol
+        """
+        return protocol.variables.get(name, self.variables.get(name, default))
+
+
+def expand(string, arguments=()):
+    """
+    Replace the arguments and escape sequences of a string from a protocol file.
+
+    Args:
+        string: the string as written in the protocol file, without quotes
+        arguments: the protocol arguments, $1 first
+
+    Returns:
+        the expanded string
+    """
+
+    def replace(match):
+        if match.group(1) is not None:
+            return arguments[int(match.group(1)) - 1]
+        return ESCAPES.get(match.group(2), match.group(2))
+
+    return ARGUMENT.sub(replace, string)
+
+
+def _tokenise(text):
+    for match in PROTOCOL_TOKEN.finditer(text):
+        if match.lastgroup is not None:
+            yield match.lastgroup, match.group(match.lastgroup)
+
+
+def _value(kind, token):
+    return token[1:-1] if kind == "string" else token
+
+
+def _end_statement(statement, protocol):
+    if len(statement) >= 3 and statement[1][1] == "=":
+        protocol.variables[statement[0][1]] = " ".join(
+            _value(kind, token) for kind, token in statement[2:]
+        )
+    elif statement:
+        protocol.commands.append(
+            (statement[0][1], [_value(kind, token) for kind, token in statement[1:]])
+        )
+
+
+def _parse_block(tokens, protocol):
+    """
+    Parse the statements of a block, up to its closing brace or the end of the file, into protocol.
+    """
+    statement = []
+    for kind, token in tokens:
+        if kind == "symbol" and token == "}":
+            break
+        if kind == "symbol" and token == "{":
+            block = Protocol(statement[0][1])
+            _parse_block(tokens, block)
+            if block.name.startswith("@"):
+                protocol.handlers[block.name] = block
+            else:
+                protocol.protocols[block.name] = block
+            statement = []
+        elif kind == "symbol" and token == ";":
+            _end_statement(statement, protocol)
+            statement = []
+        else:
+            statement.append((kind, token))
+    # the last statement of a block need not end with a semicolon
+    _end_statement(statement, protocol)
+
+
+def parse_protocol_file(path=PROTOCOL_FILE):
+    """
+    Args:
+        path: the protocol file
+
+    Returns:
+        the ProtocolFile
+    """
+    with open(path) as protocol_file:
+        text = protocol_file.read()
+    top = Protocol(None)
+    _parse_block(_tokenise(text), top)
+    return ProtocolFile(top.protocols, top.variables)
+
+
+def parse_database(path=DATABASE_FILE, macros=None):
+    """
+    Args:
+        path: the database file
+        macros: macro values, DEFAULT_MACROS if not given
+
+    Returns:
+        list of (record type, record name, dictionary of fields)
+    """
+    macros = DEFAULT_MACROS if macros is None else macros
+    with open(path) as database_file:
+        text = MACRO.sub(
+            lambda match: macros.get(match.group(1), match.group(0)), database_file.read()
+        )
+    return [
+        (record_type, name, dict(FIELD.findall(body)))
+        for record_type, name, body in RECORD.findall(text)
+    ]
+
+
+def stream_link(fields):
+    """
+    Args:
+        fields: the fields of a record
+
+    Returns:
+        (protocol file, protocol name, arguments, port) of the record's stream link, or None if it
+        does not have one
+    """
+    if fields.get("DTYP") != "stream":
+        return None
+    match = STREAM_LINK.match(fields.get("INP", fields.get("OUT", "")))
+    if match is None:
+        return None
+    protocol_file, protocol, arguments, port = match.groups()
+    arguments = tuple(argument.strip() for argument in arguments.split(",")) if arguments else ()
+    return protocol_file, protocol, arguments, port
+
+
+def scan_period(fields):
+    """
+    Args:
+        fields: the fields of a record
+
+    Returns:
+        the record's scan period in seconds, or None if it is not scanned periodically
+    """
+    match = PERIODIC_SCAN.match(fields.get("SCAN", "Passive"))
+    return float(match.group(1)) if match else None
+
+
+def protocol_requests(protocol, arguments=()):
+    """
+    Args:
+        protocol: the Protocol
+        arguments: the protocol arguments
+
+    Returns:
+        the requests the protocol sends, as bytes
+    """
+    return [
+        "".join(expand(value, arguments) for value in values).encode("ascii")
+        for command, values in protocol.commands
+        if command == "out"
+    ]
+
+
+def polled_transactions(records, protocol_file, scan="1 second"):
+    """
+    The transactions the IOC makes each scan period, in record order.
+
+    Args:
+        records: the records, as returned by parse_database
+        protocol_file: the ProtocolFile
+        scan: the scan period of the records to include
+
+    Returns:
+        list of (record name, Protocol, arguments, list of requests as bytes)
+    """
+    transactions = []
+    for _, name, fields in records:
+        link = stream_link(fields)
+        if link is None or fields.get("SCAN") != scan:
+            continue
+        protocol = protocol_file.protocol(link[1])
+        arguments = link[2]
+        transactions.append((name, protocol, arguments, protocol_requests(protocol, arguments)))
+    return transactions
@@ -0,0 +1,374 @@
+"""
+Runs the protocols of lm500Sup/lm500.proto for the records of lm500Sup/lm500.db, as StreamDevice
+would in the IOC, straight against an Lm500StreamInterface in this process.
+
+Supports what the protocol file uses: out and in formats with %d, %f, %s, %c, %[charset] and
+%/regex/ conversions, their *, # and width modifiers, redirections such as %(EGU)s and
+%(\\$1)d, protocol arguments, @init handlers, I/O Intr records reading the replies to other
+records' requests, ExtraInput and ReplyTimeout, which a reply misses if it would take longer than
+that on the device's serial line.
+"""
+
+import re
+
+from stream_config import expand, parse_database, parse_protocol_file, stream_link
+
+STATE_PREFIXES = (
+    "ZR",
+    "ON",
+    "TW",
+    "TH",
+    "FR",
+    "FV",
+    "SX",
+    "SV",
+    "EI",
+    "NI",
+    "TE",
+    "EL",
+    "TV",
+    "TT",
+    "FT",
+    "FF",
+)
+
+CONVERSION = re.compile(
+    r"%(?:\((?P<redirection>[^)]*)\))?(?P<flags>[-+ #0*?=!]*)(?P<width>\d*)(?:\.\d+)?"
+    r"(?P<type>\[\^?\]?[^\]]*\]|/(?:\\.|[^/])*/|[a-zA-Z])"
+)
+NUMBERS = {
+    "d": r"[-+]?\d+",
+    "i": r"[-+]?(?:0[xX][0-9a-fA-F]+|\d+)",
+    "u": r"\d+",
+    "x": r"[0-9a-fA-F]+",
+    "o": r"[0-7]+",
+    "f": r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?",
+}
+NUMBERS["e"] = NUMBERS["g"] = NUMBERS["f"]
+
+
+class StreamError(Exception):
+    """
+    A protocol failed, as it would in the IOC, leaving its record in alarm.
+    """
+
+
+class ReplyTimeout(StreamError):
+    """
+    The device did not reply, or not within the protocol's ReplyTimeout.
+    """
+
+
+class Record(object):
+    """
+    The value of a record of the database, as StreamDevice reads and writes it.
+    """
+
+    def __init__(self, record_type, name, fields):
+        self.type = record_type
+        self.name = name
+        self.fields = dict(fields)
+        self.states = [fields.get(prefix + "ST") for prefix in STATE_PREFIXES]
+        self.state_values = [fields.get(prefix + "VL") for prefix in STATE_PREFIXES]
+        if record_type.startswith("string"):
+            self.value = ""
+        elif record_type in ("ai", "ao"):
+            self.value = 0.0
+        else:
+            self.value = 0
+
+    @property
+    def is_multi_bit(self):
+        return self.type in ("mbbi", "mbbo")
+
+    def get(self):
+        """
+        Returns:
+            the value, the name of the state for multi-bit records
+        """
+        if self.is_multi_bit:
+            return self.states[self.value]
+        return self.value
+
+    def put(self, value):
+        """
+        Args:
+            value: the value, or the name of a state for multi-bit records
+        """
+        if self.is_multi_bit and isinstance(value, str):
+            self.value = self._state_named(value)
+        elif self.type.startswith("string"):
+            self.value = str(value)
+        elif self.type in ("ai", "ao"):
+            self.value = float(value)
+        else:
+            self.value = int(value)
+
+    def _state_named(self, name):
+        if name not in self.states:
+            raise StreamError(f"{self.name} has no state {name!r}")
+        return self.states.index(name)
+
+    def raw_value(self):
+        """
+        Returns:
+            the value as written by an integer conversion, the state's value for multi-bit records
+        """
+        if self.is_multi_bit and self.state_values[self.value] is not None:
+            return int(self.state_values[self.value])
+        return int(self.value)
+
+    def format(self, conversion):
+        """
+        Args:
+            conversion: the conversion character, e.g. "f"
+
+        Returns:
+            the value to write with the conversion
+        """
+        if conversion == "s":
+            return self.get() if self.is_multi_bit else str(self.value)
+        if conversion in "fge":
+            return float(self.value)
+        return self.raw_value()
+
+    def read(self, text, conversion, field=None):
+        """
+        Store a value read from a reply.
+
+        Args:
+            text: the text the conversion matched
+            conversion: the conversion character, e.g. "f"
+            field: the field of the record to store it in, if not its value
+        """
+        if field is not None and field != "VAL":
+            self.fields[field] = text
+        elif conversion in "fge":
+            self.put(float(text))
+        elif conversion in "diuxo":
+            number = int(text, {"x": 16, "o": 8}.get(conversion, 0 if conversion == "i" else 10))
+            if self.is_multi_bit and any(value is not None for value in self.state_values):
+                values = [None if value is None else int(value) for value in self.state_values]
+                if number not in values:
+                    raise StreamError(f"{self.name} has no state of value {number}")
+                number = values.index(number)
+            self.value = number
+        else:
+            self.put(text)
+
+
+class StreamIoc(object):
+    """
+    The stream records of the IOC, processed by running their protocols against the interface to
+    an emulated device.
+    """
+
+    def __init__(self, interface, records=None, protocol_file=None):
+        """
+        Args:
+            interface: the Lm500StreamInterface, bound to its device
+            records: the records, as returned by parse_database, those of lm500.db if not given
+            protocol_file: the ProtocolFile, lm500.proto if not given
+        """
+        self.interface = interface
+        self.protocol_file = protocol_file or parse_protocol_file()
+        self.records = {}
+        self.links = {}
+        for record_type, name, fields in parse_database() if records is None else records:
+            self.records[name] = Record(record_type, name, fields)
+            link = stream_link(fields)
+            if link is not None:
+                self.links[name] = link
+        self.interrupt_records = [
+            name for name in self.links if self.records[name].fields.get("SCAN") == "I/O Intr"
+        ]
+        self.transactions = 0
+
+    def initialise(self):
+        """
+        Run the @init handlers of the records' protocols, as when the IOC starts.
+
+        Returns:
+            dictionary of the errors by record name
+        """
+        errors = {}
+        for name in self.links:
+            try:
+                protocol = self._protocol(name)
+                if "@init" in protocol.handlers:
+                    self._run(name, protocol, protocol.handlers["@init"])
+            except StreamError as error:
+                errors[name] = error
+        return errors
+
+    def get(self, name):
+        return self.records[name].get()
+
+    def process(self, name):
+        """
+        Process a stream record, running its protocol.
+
+        Args:
+            name: the record name
+
+        Returns:
+            the record's value
+        """
+        protocol = self._protocol(name)
+        self._run(name, protocol, protocol)
+        return self.get(name)
+
+    def put(self, name, value):
+        """
+        Put a value to a record and process it, as a channel access put does.
+
+        Args:
+            name: the record name
+            value: the value, or the name of a state for multi-bit records
+        """
+        self.records[name].put(value)
+        self.process(name)
+
+    def _protocol(self, name):
+        protocol_name = self.links[name][1]
+        try:
+            return self.protocol_file.protocol(protocol_name)
+        except KeyError:
+            raise StreamError(f"{name}: no protocol {protocol_name} in the protocol file")
+
+    def _variable(self, protocol, name, default):
+        return self.protocol_file.variable(protocol, name, default)
+
+    def _run(self, name, protocol, block):
+        arguments = self.links[name][2]
+        reply = None
+        for command, values in block.commands:
+            format_string = expand("".join(values), arguments)
+            if command == "out":
+                reply = self._transact(name, protocol, self._format(name, format_string))
+            elif command == "in":
+                if reply is None:
+                    raise ReplyTimeout(f"{name}: no reply to read with {format_string!r}")
+                self._scan(name, protocol, format_string, reply)
+                reply = None
+            else:
+                raise StreamError(f"{name}: command {command} is not supported")
+
+    def _format(self, name, format_string):
+        record = self.records[name]
+
+        def replace(match):
+            if match.group("redirection") is not None:
+                raise StreamError(f"{name}: redirection in output {format_string!r}")
+            conversion = match.group("type")
+            spec = match.group(0).replace(match.group("flags"), match.group("flags").strip("*"))
+            return spec % record.format(conversion)
+
+        return CONVERSION.sub(replace, format_string.replace("%%", "\0")).replace("\0", "%")
+
+    def _transact(self, name, protocol, request):
+        self.transactions += 1
+        request = request.encode()
+        try:
+            reply = self.interface.handle_request(request)
+        except (RuntimeError, ValueError):
+            # the device replies to nothing it does not understand, as when no command matches a
+            # request or its arguments are invalid
+            reply = None
+        except Exception as error:
+            raise StreamError(f"{name}: the emulator failed on {request!r}: {error!r}")
+        if reply is None:
+            return None
+
+        reply = str(reply)
+        timeout = float(self._variable(protocol, "ReplyTimeout", 1000)) / 1000
+        line = self.interface.device.serial_line
+        seconds = line.transaction_time(
+            len(request) + len(self.interface.in_terminator),
+            len(reply) + len(self.interface.out_terminator),
+        )
+        if seconds > timeout:
+            raise ReplyTimeout(
+                f"{name}: the reply takes {seconds * 1000:.0f} ms, more than ReplyTimeout"
+            )
+        for interrupt_record in self.interrupt_records:
+            self._interrupt(interrupt_record, reply)
+        return reply
+
+    def _interrupt(self, name, reply):
+        protocol = self._protocol(name)
+        for command, values in protocol.commands:
+            if command == "in":
+                try:
+                    self._scan(name, protocol, expand("".join(values)), reply)
+                except StreamError:
+                    pass
+
+    def _scan(self, name, protocol, format_string, reply):
+        """
+        Read a reply with an input format into the record and those it redirects to.
+        """
+        pattern = []
+        targets = []
+        position = 0
+        for match in CONVERSION.finditer(format_string):
+            pattern.append(re.escape(format_string[position : match.start()].replace("%%", "%")))
+            position = match.end()
+            pattern.append(self._conversion_pattern(match))
+            if "*" not in match.group("flags"):
+                targets.append((match.group("redirection"), match.group("type")[0]))
+        pattern.append(re.escape(format_string[position:].replace("%%", "%")))
+
+        regex = re.compile("".join(pattern), re.DOTALL)
+        if self._variable(protocol, "ExtraInput", "Error") == "Ignore":
+            matched = regex.match(reply)
+        else:
+            matched = regex.fullmatch(reply)
+        if matched is None:
+            raise StreamError(f"{name}: {reply!r} does not match {format_string!r}")
+
+        for (redirection, conversion), text in zip(targets, matched.groups()):
+            record, field = self._target(name, redirection)
+            record.read(text, conversion, field)
+
+    @staticmethod
+    def _conversion_pattern(match):
+        conversion = match.group("type")
+        flags = match.group("flags")
+        width = match.group("width")
+        repeat = f"{{1,{width}}}" if width else "+"
+        if conversion.startswith("/"):
+            pattern = f"(?:{conversion[1:-1]})"
+        elif conversion.startswith("["):
+            pattern = conversion + repeat
+        elif conversion in NUMBERS:
+            pattern = r"\s*" + NUMBERS[conversion]
+        elif conversion == "c":
+            pattern = f".{{{width or 1}}}"
+        elif "#" in flags:
+            # a string which may contain spaces
+            pattern = r"\s*.+"
+        else:
+            pattern = r"\s*\S" + repeat
+        if "*" in flags:
+            return f"(?:{pattern})"
+        if conversion in NUMBERS or conversion == "s":
+            # the value itself, without the whitespace skipped before it
+            return pattern.replace(r"\s*", r"\s*(", 1) + ")"
+        return f"({pattern})"
+
+    def _target(self, name, redirection):
+        """
+        Returns:
+            (Record, field or None) a conversion with the redirection, if any, reads into
+        """
+        if redirection is None:
+            return self.records[name], None
+        if redirection in self.records:
+            return self.records[redirection], None
+        record, _, field = redirection.rpartition(".")
+        if record in self.records:
+            return self.records[record], field
+        if not record and redirection.isupper():
+            return self.records[name], redirection
+        raise StreamError(f"{name}: no record to redirect to in {redirection}")
@@ -1,17 +1,22 @@
+import os
+import time
 import unittest
 
 from parameterized import parameterized
 from utils.channel_access import ChannelAccess
-from utils.ioc_launcher import get_default_ioc_dir
+from utils.ioc_launcher import IOCRegister, get_default_ioc_dir
 from utils.test_modes import TestModes
 from utils.testing import get_running_lewis_and_ioc, skip_if_recsim
 
-DEVICE_PREFIX = "LM500_01"
+# The IOC instance to test, so that parallel runs can each use their own, see run_parallel.py
+IOC_NUMBER = int(os.environ.get("LM500_IOC_NUMBER", "1"))
+
+DEVICE_PREFIX = f"LM500_{IOC_NUMBER:02d}"
 
 IOCS = [
     {
         "name": DEVICE_PREFIX,
-        "directory": get_default_ioc_dir("LM500"),
+        "directory": get_default_ioc_dir("LM500", iocnum=IOC_NUMBER),
         "macros": {},
         "emulator": "Lm500",
     },
@@ -28,10 +33,18 @@ class Lm500Tests(unittest.TestCase):
     def setUp(self):
         self._lewis, self._ioc = get_running_lewis_and_ioc("Lm500", DEVICE_PREFIX)
         self.ca = ChannelAccess(device_prefix=DEVICE_PREFIX)
+        self.reset_device()
         self.ca.set_pv_value("INTRVL:HOUR:SP", 0)
         self.ca.set_pv_value("INTRVL:MIN:SP", 0)
         self.ca.set_pv_value("INTRVL:SEC:SP", 0)
 
+    def reset_device(self):
+        """
+        Put the emulated device back in its initial state, so that no test sees what another left.
+        """
+        if not IOCRegister.uses_rec_sim:
+            self._lewis.backdoor_run_function_on_device("reset")
+
     @parameterized.expand(["Off", "On", "Smart"])
     def test_that_WHEN_boost_mode_is_set_THEN_rb_matches(self, mode):
         self.ca.assert_setting_setpoint_sets_readback(
@@ -276,3 +289,137 @@ class Lm500Tests(unittest.TestCase):
         for bit in second_bits:
             self.ca.assert_that_pv_is_number(f"CHAN2:{pvs[pv]}.RVAL", bit)
             pv = pv + 1
+
+    @skip_if_recsim("Uses emulator backdoor")
+    def test_that_WHEN_channel_measured_below_alarm_threshold_THEN_only_its_alarm_bit_set(self):
+        self.ca.assert_that_pv_is_number("STATUS:BIT:0", 0)
+        self.ca.assert_that_pv_is_number("STATUS:BIT:1", 0)
+
+        self._lewis.backdoor_set_on_device("alarm_threshold", "10")
+        self.ca.set_pv_value("MEAS:CHAN1:SP", 1)
+        self.ca.assert_that_pv_is_number("CHAN1:ALARM:STATUS.RVAL", 1)
+        self.ca.assert_that_pv_is_number("CHAN2:ALARM:STATUS.RVAL", 0)
+
+    @skip_if_recsim("Uses emulator backdoor")
+    def test_that_WHEN_fill_started_and_time_advanced_THEN_channel_filled_to_high_threshold(self):
+        self.ca.set_pv_value("HIGH:SP", 50)
+        self.ca.assert_that_pv_is_number("HIGH", 50)
+        self._lewis.backdoor_set_on_device("fill_speed", 10)
+        self._lewis.backdoor_run_function_on_device("fill", [1])
+        self._lewis.backdoor_run_function_on_device("advance_time", [10])
+
+        self._lewis.assert_that_emulator_value_is("state", "idle")
+        self.ca.set_pv_value("MEAS:CHAN1:SP", 1)
+        self.ca.assert_that_pv_is_number("MEAS:CHAN1", 50)
+
+    @skip_if_recsim("Uses emulator backdoor")
+    def test_that_WHEN_device_reset_and_fill_started_THEN_channel_fills(self):
+        self._lewis.backdoor_run_function_on_device("reset")
+        self._lewis.backdoor_run_function_on_device("fill", [1])
+        self._lewis.backdoor_run_function_on_device("advance_time", [5])
+
+        self._lewis.assert_that_emulator_value_is("state", "chan1")
+        self._lewis.backdoor_run_function_on_device("advance_time", [10])
+        self._lewis.assert_that_emulator_value_is("state", "idle")
+
+    @skip_if_recsim("Uses emulator backdoor")
+    def test_that_WHEN_fill_exceeds_max_fill_time_THEN_fill_status_is_timeout(self):
+        self.ca.set_pv_value("HIGH:SP", 6000)
+        self.ca.assert_that_pv_is_number("HIGH", 6000)
+        self._lewis.backdoor_set_on_device("fill_speed", 0)
+        self._lewis.backdoor_run_function_on_device("fill", [2])
+        self._lewis.backdoor_run_function_on_device("advance_time", [60])
+        self.ca.assert_that_pv_is("FILL:CHAN2", "1 min")
+
+        self._lewis.backdoor_run_function_on_device("advance_time", [120])
+
+        self._lewis.assert_that_emulator_value_is("state", "idle")
+        self.ca.assert_that_pv_is("FILL:CHAN2", "Timeout")
+
+    @skip_if_recsim("Uses emulator backdoor")
+    def test_that_WHEN_fill_started_and_times_out_THEN_refill_status_bits_follow(self):
+        self.ca.set_pv_value("HIGH:SP", 6000)
+        self.ca.assert_that_pv_is_number("HIGH", 6000)
+        self._lewis.backdoor_set_on_device("fill_speed", 0)
+        self._lewis.backdoor_run_function_on_device("fill", [2])
+        self._lewis.backdoor_run_function_on_device("advance_time", [1])
+        self.ca.assert_that_pv_is_number("CHAN2:REFILL.RVAL", 1)
+        self.ca.assert_that_pv_is_number("CHAN2:REFILL:TIMEOUT.RVAL", 0)
+
+        self._lewis.backdoor_run_function_on_device("advance_time", [180])
+
+        self.ca.assert_that_pv_is_number("CHAN2:REFILL.RVAL", 0)
+        self.ca.assert_that_pv_is_number("CHAN2:REFILL:TIMEOUT.RVAL", 1)
+
+    @skip_if_recsim("Uses emulator backdoor")
+    def test_that_WHEN_measurement_takes_time_THEN_read_in_progress_until_it_ends(self):
+        self._lewis.backdoor_set_on_device("measurement_duration", 60)
+        self.ca.set_pv_value("MEAS:CHAN1:SP", 1)
+        self.ca.assert_that_pv_is_number("CHAN1:READ.RVAL", 1)
+
+        self._lewis.backdoor_run_function_on_device("advance_time", [60])
+
+        self.ca.assert_that_pv_is_number("CHAN1:READ.RVAL", 0)
+
+    @skip_if_recsim("Uses emulator backdoor")
+    def test_that_WHEN_helium_sensor_measured_THEN_read_takes_time_for_its_length(self):
+        self._lewis.backdoor_set_on_device("sensor_length", 30)
+        self._lewis.backdoor_run_function_on_device("set_measurement_model", [20, 0])
+        self.ca.set_pv_value("MEAS:CHAN1:SP", 1)
+        self.ca.set_pv_value("MEAS:CHAN2:SP", 1)
+        self.ca.assert_that_pv_is_number("CHAN1:READ.RVAL", 0)
+        self.ca.assert_that_pv_is_number("CHAN2:READ.RVAL", 1)
+
+        self._lewis.backdoor_run_function_on_device("advance_time", [300])
+        self.ca.assert_that_pv_is_number("CHAN2:READ.RVAL", 1)
+
+        self._lewis.backdoor_run_function_on_device("advance_time", [300])
+        self.ca.assert_that_pv_is_number("CHAN2:READ.RVAL", 0)
+
+    @skip_if_recsim("Uses emulator backdoor")
+    def test_that_WHEN_fill_started_THEN_fill_started_and_stopped_events_pushed(self):
+        # only this test needs the emulator's event client, so it alone fails if it cannot load
+        from lewis_emulators.Lm500.events import EventSubscription
+
+        self._lewis.backdoor_run_function_on_device("start_events")
+        port = int(self._lewis.backdoor_get_from_device("event_port"))
+        self.ca.set_pv_value("HIGH:SP", 5)
+        self.ca.assert_that_pv_is_number("HIGH", 5)
+        self._lewis.backdoor_set_on_device("fill_speed", 1)
+
+        with EventSubscription(port) as events:
+            self._lewis.backdoor_run_function_on_device("fill", [1])
+            events.wait_for_value("state", "chan1")
+            events.wait_for_value("state", "idle")
+            self.assertEqual(events.values["chan1.value"], 5)
+
+    @skip_if_recsim("Uses emulator backdoor")
+    def test_that_WHEN_replies_take_as_long_as_on_a_9600_baud_line_THEN_rb_matches(self):
+        self._lewis.backdoor_run_function_on_device("set_serial_timing", [9600, "8N1", 0.02])
+        self.addCleanup(self._lewis.backdoor_run_function_on_device, "set_serial_timing", [0])
+
+        self.ca.assert_setting_setpoint_sets_readback(
+            25, readback_pv="HIGH", set_point_pv="HIGH:SP"
+        )
+
+    @skip_if_recsim("Uses emulator backdoor")
+    def test_that_WHEN_replies_wait_for_a_slow_serial_line_THEN_simulation_carries_on(self):
+        self._lewis.backdoor_run_function_on_device("set_serial_timing", [9600, "8N1", 5])
+        self.addCleanup(self._lewis.backdoor_run_function_on_device, "set_serial_timing", [0])
+
+        # the IOC's polls keep the line busy, but the backdoor is not held up behind them
+        start = time.monotonic()
+        self._lewis.backdoor_run_function_on_device("fill", [1])
+        self._lewis.backdoor_run_function_on_device("advance_time", [5])
+        self._lewis.assert_that_emulator_value_is("state", "chan1")
+        self.assertLess(time.monotonic() - start, 5)
+
+    @skip_if_recsim("Uses emulator backdoor")
+    def test_that_WHEN_channel_1_reads_time_out_THEN_channel_2_records_in_alarm(self):
+        # replies take longer than the protocols' ReplyTimeout
+        self._lewis.backdoor_run_function_on_device("set_serial_timing", [9600, "8N1", 5])
+        self.addCleanup(self._lewis.backdoor_run_function_on_device, "set_serial_timing", [0])
+
+        for kind in ("TYPE", "FILL", "MEAS"):
+            self.ca.assert_that_pv_alarm_is(f"{kind}:CHAN1", self.ca.Alarms.INVALID, timeout=30)
+            self.ca.assert_that_pv_alarm_is(f"{kind}:CHAN2", self.ca.Alarms.INVALID, timeout=30)
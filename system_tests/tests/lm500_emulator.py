@@ -0,0 +1,104 @@
+import os
+import random
+import unittest
+
+from lewis_emulators.Lm500 import SimulatedLm500
+from lewis_emulators.Lm500.interfaces import Lm500StreamInterface
+from protocol_checks import PREFIX, new_ioc, process_all, run_setpoint_cases
+from replay_transcripts import TRANSCRIPT_DIR, replay_file, transcript_files
+from stream_config import parse_database, stream_link
+from utils.test_modes import TestModes
+
+# Checks of the emulator and the IOC's support files run in this process, with no IOC to start
+IOCS = []
+
+TEST_MODES = [TestModes.DEVSIM]
+
+# Requests sent to a fleet's devices and to plain devices alike, in random order
+FLEET_COMMANDS = ["FILL 1", "FILL 2", "FILL", "HIGH 3", "HIGH 50", "MEAS 1", "MEAS 2", "MODE S"]
+FLEET_QUERIES = ["FILL? 1", "FILL? 2", "MEAS? 1", "MEAS? 2", "STAT?", "HIGH?"]
+
+
+def _interface(device):
+    interface = Lm500StreamInterface()
+    interface.device = device
+    return interface
+
+
+def _reply(interface, request):
+    try:
+        return interface.handle_request(request.encode())
+    except Exception as error:
+        return type(error).__name__
+
+
+class Lm500EmulatorTests(unittest.TestCase):
+    """
+    Tests of the Lm500 emulator and the IOC's protocols, without an IOC or channel access.
+    """
+
+    def test_that_WHEN_protocols_run_against_emulator_THEN_no_record_fails(self):
+        # interprets lm500Sup/lm500.proto for the records of lm500Sup/lm500.db, so checks the
+        # protocol names and requests the IOC would send
+        ioc = new_ioc()
+        self.assertEqual(ioc.initialise(), {})
+        self.assertEqual(process_all(ioc), {})
+        _, failures = run_setpoint_cases(ioc, (0,))
+        self.assertEqual(failures, {})
+
+    def test_that_WHEN_channel_1_read_fails_THEN_channel_2_record_takes_its_alarm(self):
+        records = {name: fields for _, name, fields in parse_database()}
+        for kind in ("TYPE", "FILL", "MEAS"):
+            with self.subTest(kind=kind):
+                channel_1, channel_2 = f"{PREFIX}{kind}:CHAN1", f"{PREFIX}{kind}:CHAN2"
+                # channel 2 is read by channel 1's protocol, so cannot time out itself
+                self.assertEqual(stream_link(records[channel_1])[2], (channel_2,))
+                self.assertEqual(records[channel_2]["DTYP"], "Soft Channel")
+                update = records[records[channel_1]["FLNK"]]
+                self.assertEqual(update["INPA"], f"{channel_1}.SEVR NPP MS")
+                self.assertEqual(update["OUT"], f"{channel_2}.PROC PP MS")
+
+    def test_that_WHEN_transcripts_replayed_THEN_replies_match_recording(self):
+        for path in transcript_files([TRANSCRIPT_DIR]):
+            with self.subTest(transcript=os.path.basename(path)):
+                _, mismatches = replay_file(path)
+                self.assertEqual(mismatches, [])
+
+    def test_that_GIVEN_fleet_WHEN_simulated_THEN_devices_reply_as_plain_devices(self):
+        try:
+            from emulator_fleet import Fleet
+        except ImportError:
+            self.skipTest("The fleet needs NumPy")
+        count = 8
+        rng = random.Random(1)
+        for fill_speed in (0, 0.5, 7):
+            with self.subTest(fill_speed=fill_speed):
+                fleet = Fleet(count)
+                plain = [SimulatedLm500() for _ in range(count)]
+                for fleet_device, device in zip(fleet.devices, plain):
+                    fleet_device.fill_speed = device.fill_speed = fill_speed
+                    fleet_device.measurement_duration = device.measurement_duration = 0
+                pairs = [(_interface(a), _interface(b)) for a, b in zip(fleet.devices, plain)]
+                # fills requested before the first cycle, which only enters the initial state
+                for fleet_interface, interface in pairs:
+                    self.assertEqual(_reply(fleet_interface, "FILL 1"), _reply(interface, "FILL 1"))
+
+                for cycle in range(300):
+                    for fleet_interface, interface in pairs:
+                        if rng.random() < 0.05:
+                            request = rng.choice(FLEET_COMMANDS)
+                            self.assertEqual(
+                                _reply(fleet_interface, request), _reply(interface, request)
+                            )
+                    dt = rng.choice([0.1, 0.5, 7])
+                    fleet.process(dt)
+                    for device in plain:
+                        device.process(dt)
+                    for index, (fleet_interface, interface) in enumerate(pairs):
+                        for request in FLEET_QUERIES:
+                            self.assertEqual(
+                                _reply(fleet_interface, request),
+                                _reply(interface, request),
+                                f"{request} of device {index} after cycle {cycle}",
+                            )
+                        self.assertEqual(fleet.devices[index].state, plain[index].state)